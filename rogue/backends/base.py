@@ -1,27 +1,81 @@
 from abc import ABCMeta, abstractmethod
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Any
+import asyncio
+import contextvars
+import threading
 
 from rogue.settings import settings
 
 from .errors import OperationalError, InvalidComparisonError
+from .pool import ConnectionPool
 
 
 class BaseDatabaseClient(metaclass=ABCMeta):
     _instances = {}
+    _instances_lock = threading.Lock()
     _db_name = None
 
+    supports_returning = False
+
     def __new__(cls, db_name=settings.DATABASE_NAME):
-        if db_name not in cls._instances:
-            cls._instances[db_name] = super().__new__(cls)
+        with cls._instances_lock:
+            if db_name not in cls._instances:
+                instance = super().__new__(cls)
+                instance._setup(db_name)
+                cls._instances[db_name] = instance
 
         return cls._instances[db_name]
 
-    def __init__(self, db_name=settings.DATABASE_NAME):
+    def _setup(self, db_name):
+        # Runs once per database. __new__ returns the same client afterwards,
+        # so its connections and any transaction in progress are kept.
         self._db_name = db_name
 
-        self._connection = None
+        self._pool = ConnectionPool(
+            self._connect,
+            max_size=settings.DATABASE_POOL_SIZE,
+            idle_timeout=settings.DATABASE_POOL_IDLE_TIMEOUT,
+            timeout=settings.DATABASE_POOL_TIMEOUT,
+        )
+        self._readers = ConnectionPool(
+            self._connect_reader,
+            max_size=settings.DATABASE_READERS,
+            idle_timeout=settings.DATABASE_POOL_IDLE_TIMEOUT,
+            timeout=settings.DATABASE_POOL_TIMEOUT,
+        )
+        # Threads for the async API. Each one borrows its own connections.
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.DATABASE_ASYNC_WORKERS,
+            thread_name_prefix=f"rogue-{db_name}",
+        )
+        self._local = threading.local()
+
+    @property
+    def _atomic_depth(self):
+        return getattr(self._local, "atomic_depth", 0)
+
+    @_atomic_depth.setter
+    def _atomic_depth(self, value):
+        self._local.atomic_depth = value
+
+    @abstractmethod
+    def _connect(self):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def _connect_reader(self):  # pragma: no cover
+        pass
+
+    @property
+    def has_readers(self):
+        return self._readers.max_size > 0
+
+    @abstractmethod
+    def open(self):  # pragma: no cover
+        pass
 
     @abstractmethod
     def get_connection(self):  # pragma: no cover
@@ -31,10 +85,58 @@ class BaseDatabaseClient(metaclass=ABCMeta):
     def execute(self, statement, *args, **kwargs):  # pragma: no cover
         pass
 
+    async def run_async(self, func, *args):
+        # The transaction belongs to this thread, a worker would run outside of it
+        if self.in_atomic_block:
+            raise OperationalError("Async queries cannot run inside atomic.")
+
+        # Like asyncio.to_thread, the worker sees the caller's context variables
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, context.run, self._run_and_release, func, *args
+        )
+
+    def _run_and_release(self, func, *args):
+        try:
+            return func(*args)
+        finally:
+            self.release()
+
+    @abstractmethod
+    def execute_read(self, statement, args=()):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def execute_many(self, statement, args):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def get_max_variable_number(self):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def atomic(self):  # pragma: no cover
+        pass
+
+    @property
+    def in_atomic_block(self):
+        return self._atomic_depth > 0
+
+    @abstractmethod
+    def release(self):  # pragma: no cover
+        pass
+
     @abstractmethod
     def close(self):  # pragma: no cover
         pass
 
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
 
 @dataclass
 class WhereStatement:
@@ -45,6 +147,13 @@ class WhereStatement:
     relation_descriptor: Any
 
 
+@dataclass
+class OrderByStatement:
+    table_name: str
+    field: str
+    descending: bool
+
+
 class BaseQueryBuilder(metaclass=ABCMeta):
     SELECT = "SELECT"
     UPDATE = "UPDATE"
@@ -55,8 +164,17 @@ class BaseQueryBuilder(metaclass=ABCMeta):
     WHERE = "WHERE"
     AND = "AND"
     VALUES = "VALUES"
+    RETURNING = "RETURNING"
     INNER_JOIN = "INNER JOIN"
+    LEFT_JOIN = "LEFT JOIN"
     ON = "ON"
+    ORDER_BY = "ORDER BY"
+    ASC = "ASC"
+    DESC = "DESC"
+    LIMIT = "LIMIT"
+    OFFSET = "OFFSET"
+    COUNT_ALL = "COUNT(*)"
+    GROUP_BY = "GROUP BY"
 
     EQUAL = "equal"
     IN = "in"
@@ -72,11 +190,28 @@ class BaseQueryBuilder(metaclass=ABCMeta):
 
     COMPARISON_DEFAULT = EQUAL
 
+    RELATED_ROWS = "__related_rows"
+
+    DICT_ROWS = "dict"
+    TUPLE_ROWS = "tuple"
+    FLAT_ROWS = "flat"
+
     def __init__(self, client, model):
         self.client = client
         self.model = model
 
         self.where_statements = []
+        self.related_selections = {}
+        self.annotations = {}
+        self.order_by_statements = []
+        self.limit = None
+        self.offset = 0
+
+        # Replace the model fields in the select when set, keyed by alias
+        self.selected_fields = None
+        self.group_by_statements = []
+        self.relation_joins = []
+        self.row_format = self.DICT_ROWS
 
     @property
     def table_name(self):
@@ -121,6 +256,73 @@ class BaseQueryBuilder(metaclass=ABCMeta):
         )
         return self
 
+    def copy(self):
+        query = self.__class__(self.client, self.model)
+        query.where_statements = list(self.where_statements)
+        query.related_selections = dict(self.related_selections)
+        query.annotations = dict(self.annotations)
+        query.order_by_statements = list(self.order_by_statements)
+        query.limit = self.limit
+        query.offset = self.offset
+        query.selected_fields = (
+            None if self.selected_fields is None else dict(self.selected_fields)
+        )
+        query.group_by_statements = list(self.group_by_statements)
+        query.relation_joins = list(self.relation_joins)
+        query.row_format = self.row_format
+        return query
+
+    def annotate(self, **annotations):
+        self.annotations.update(annotations)
+        return self
+
+    def order_by(self, *, table_name, field, descending=False):
+        self.order_by_statements.append(
+            OrderByStatement(table_name=table_name, field=field, descending=descending)
+        )
+        return self
+
+    def set_limits(self, start=None, stop=None):
+        # Bounds are relative to the current window, so slicing a slice narrows it
+        if stop is not None:
+            stop = self.offset + stop
+            if self.limit is not None:
+                stop = min(stop, self.offset + self.limit)
+        elif self.limit is not None:
+            stop = self.offset + self.limit
+
+        if start is not None:
+            self.offset += start
+            if stop is not None:
+                self.offset = min(self.offset, stop)
+
+        self.limit = None if stop is None else stop - self.offset
+        return self
+
+    @property
+    def is_sliced(self):
+        return self.limit is not None or self.offset > 0
+
+    def join(self, relation_descriptor):
+        self.relation_joins.append(relation_descriptor)
+        return self
+
+    def select(self, **fields):
+        if self.selected_fields is None:
+            self.selected_fields = {}
+
+        self.selected_fields.update(fields)
+        return self
+
+    def group_by(self, alias, column):
+        self.select(**{alias: column})
+        self.group_by_statements.append(column)
+        return self
+
+    def select_related(self, lookup, relation_descriptor):
+        self.related_selections[lookup] = relation_descriptor
+        return self
+
     @abstractmethod
     def fetch_one(self):  # pragma: no cover
         pass
@@ -129,20 +331,35 @@ class BaseQueryBuilder(metaclass=ABCMeta):
     def fetch_all(self):  # pragma: no cover
         pass
 
+    @abstractmethod
+    def fetch_chunks(self, chunk_size):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def count(self):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def exists(self):  # pragma: no cover
+        pass
+
     @abstractmethod
     def insert(self, data):  # pragma: no cover
         pass
 
     @abstractmethod
-    def update(self, pk, data):  # pragma: no cover
+    def bulk_insert(self, rows, returning=True):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def update(self, data, returning=False):  # pragma: no cover
         pass
 
     @abstractmethod
-    def delete(self, pk):  # pragma: no cover
+    def delete(self):  # pragma: no cover
         pass
 
     def _format_input_row(self, headers, data):
-        headers = list(data)
         formatted_data = [data[header] for header in headers]
         return formatted_data
 
@@ -161,13 +378,48 @@ class BaseQueryBuilder(metaclass=ABCMeta):
         if not data or data[0] is None:
             return formatted_data
 
+        if self.row_format == self.TUPLE_ROWS:
+            return [tuple(row) for row in data]
+
+        if self.row_format == self.FLAT_ROWS:
+            return [row[0] for row in data]
+
+        fields = self.fields if self.selected_fields is None else self.selected_fields
+        headers = [*fields, *self.annotations]
+
         for row in data:
-            formatted_data.append(dict(zip(self.fields.keys(), row)))
+            formatted_row = dict(zip(headers, row))
+
+            if self.related_selections:
+                formatted_row[self.RELATED_ROWS] = self._format_related_row(
+                    row[len(headers) :]
+                )
+
+            formatted_data.append(formatted_row)
 
         return formatted_data
 
+    def _format_related_row(self, row):
+        related_rows = {}
+        offset = 0
+
+        for lookup, relation_descriptor in self.related_selections.items():
+            fields = relation_descriptor.related_model.get_fields()
+            related_rows[lookup] = dict(zip(fields, row[offset : offset + len(fields)]))
+            offset += len(fields)
+
+        return related_rows
+
+    @abstractmethod
+    def _build_select(self, fields=None):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def _build_count(self):  # pragma: no cover
+        pass
+
     @abstractmethod
-    def _build_select(self):  # pragma: no cover
+    def _build_exists(self):  # pragma: no cover
         pass
 
     @abstractmethod
@@ -175,17 +427,33 @@ class BaseQueryBuilder(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def _build_update(self, pk, data):  # pragma: no cover
+    def _build_bulk_insert(self, headers, rows):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def _build_update(self, data):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def _build_delete(self):  # pragma: no cover
         pass
 
     @abstractmethod
-    def _build_delete(self, pk):  # pragma: no cover
+    def _build_joins(self):  # pragma: no cover
         pass
 
     @abstractmethod
     def _build_where(self):  # pragma: no cover
         pass
 
+    @abstractmethod
+    def _build_order_by(self):  # pragma: no cover
+        pass
+
+    @abstractmethod
+    def _build_limits(self):  # pragma: no cover
+        pass
+
     def _validate_data(self, data):
         assert data is not None, "Cannot insert without data."
 
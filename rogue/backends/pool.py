@@ -0,0 +1,163 @@
+import threading
+import time
+
+from .errors import OperationalError
+
+
+class ConnectionPool:
+    # A thread either pins a connection until it releases it, for the length
+    # of a transaction, or borrows one for a single statement. A connection is
+    # only ever used by one thread at a time. With shares_borrowed, while a
+    # thread still reads from a borrowed connection, its other statements and
+    # transactions run on it too, a second connection could not take the lock
+    # the read holds.
+    shares_borrowed = True
+
+    def __init__(self, connect, max_size, idle_timeout, timeout):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._idle = []
+        self._checked_out = {}
+        # Borrowed connection: [thread, number of statements still using it]
+        self._borrowed = {}
+        # Borrowed past max_size, closed once given back
+        self._overflow = set()
+        self._condition = threading.Condition()
+
+    @property
+    def size(self):
+        in_use = set(self._checked_out.values()) | set(self._borrowed)
+        return len(self._idle) + len(in_use)
+
+    def get_connection(self):
+        return self._checked_out.get(threading.current_thread())
+
+    def acquire(self):
+        thread = threading.current_thread()
+
+        with self._condition:
+            if thread not in self._checked_out:
+                connection = self._get_borrowed(thread)
+                if connection is None:
+                    connection = self._take()
+
+                self._checked_out[thread] = connection
+
+            return self._checked_out[thread]
+
+    def checkout(self, overflow=False):
+        thread = threading.current_thread()
+
+        with self._condition:
+            connection = self._get_borrowed(thread)
+            if connection is not None:
+                self._borrowed[connection][1] += 1
+                return connection
+
+            # With overflow, a full pool opens one more rather than waiting
+            connection = self._take(block=not overflow)
+            if connection is None:
+                connection = self._connect()
+                self._overflow.add(connection)
+
+            self._borrowed[connection] = [thread, 1]
+            return connection
+
+    def checkin(self, connection):
+        with self._condition:
+            if connection not in self._borrowed:
+                return
+
+            self._borrowed[connection][1] -= 1
+            if self._borrowed[connection][1] > 0:
+                return
+
+            del self._borrowed[connection]
+            if connection in self._overflow:
+                self._overflow.remove(connection)
+                connection.close()
+            # A transaction started meanwhile keeps it until released
+            elif connection not in self._checked_out.values():
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def _get_borrowed(self, thread):
+        if not self.shares_borrowed:
+            return
+
+        for connection, (borrower, _) in self._borrowed.items():
+            if borrower is thread:
+                return connection
+
+    def _take(self, block=True):
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            self._evict_idle()
+
+            if self._idle:
+                connection, _ = self._idle.pop()
+                return connection
+
+            if self.size < self.max_size or self._reclaim_dead_threads():
+                return self._connect()
+
+            if not block:
+                return
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._condition.wait(remaining):
+                raise OperationalError(
+                    f"No connection was released within {self.timeout} seconds."
+                )
+
+    def release(self):
+        with self._condition:
+            connection = self._checked_out.pop(threading.current_thread(), None)
+
+            # Statements still reading from it give it back once they are done
+            if connection is not None and connection not in self._borrowed:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def discard(self):
+        with self._condition:
+            connection = self._checked_out.pop(threading.current_thread(), None)
+
+            if connection is not None:
+                self._borrowed.pop(connection, None)
+                connection.close()
+                self._condition.notify()
+
+    def close_idle(self):
+        with self._condition:
+            for connection, _ in self._idle:
+                connection.close()
+
+            self._idle = []
+
+    def _evict_idle(self):
+        expired_at = time.monotonic() - self.idle_timeout
+        idle = []
+
+        for connection, released_at in self._idle:
+            if released_at < expired_at:
+                connection.close()
+            else:
+                idle.append((connection, released_at))
+
+        self._idle = idle
+
+    def _reclaim_dead_threads(self):
+        # Threads that ended without releasing their connection
+        dead_threads = [thread for thread in self._checked_out if not thread.is_alive()]
+
+        for thread in dead_threads:
+            connection = self._checked_out.pop(thread)
+            self._borrowed.pop(connection, None)
+            connection.close()
+
+        return bool(dead_threads)
@@ -1,3 +1,6 @@
+from contextlib import contextmanager
+from pathlib import Path
+
 from rogue.settings import settings
 
 from ..base import BaseDatabaseClient
@@ -6,20 +9,370 @@ import sqlite3
 from ..errors import OperationalError
 
 
+# Compile-time default of SQLITE_MAX_VARIABLE_NUMBER before SQLite 3.32
+DEFAULT_MAX_VARIABLE_NUMBER = 999
+
+# Default size of the sqlite3 prepared statement cache
+DEFAULT_CACHED_STATEMENTS = 128
+
+PRAGMA_OPTIONS = (
+    "journal_mode",
+    "synchronous",
+    "mmap_size",
+    "cache_size",
+    "temp_store",
+    "busy_timeout",
+    "query_only",
+)
+
+OPTION_PRESETS = {
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "cached_statements": 512,
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    "readonly": {
+        "query_only": True,
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+        "cached_statements": 512,
+    },
+}
+
+
+class PooledCursor(sqlite3.Cursor):
+    # Cursor on a connection borrowed for one statement. The connection goes
+    # back to its pool once every row was read, or the cursor is closed.
+    _pool = None
+
+    def return_to(self, pool):
+        self._pool = pool
+
+        # Nothing left to read from writes
+        if self.description is None:
+            self._checkin()
+
+    def _checkin(self):
+        pool, self._pool = self._pool, None
+
+        if pool is not None:
+            pool.checkin(self.connection)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is None:
+            self._checkin()
+
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = super().fetchmany(size)
+        if len(rows) < size:
+            self._checkin()
+
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._checkin()
+        return rows
+
+    def __next__(self):
+        try:
+            return super().__next__()
+        except StopIteration:
+            self._checkin()
+            raise
+
+    def close(self):
+        super().close()
+        self._checkin()
+
+    def __del__(self):
+        if self._pool is None:
+            return
+
+        # The statement is only reset after __del__, another thread could
+        # take the connection while it still holds the read lock
+        try:
+            super().close()
+        except sqlite3.ProgrammingError:
+            # The connection was closed already
+            pass
+
+        self._checkin()
+
+
 class DatabaseClient(BaseDatabaseClient):
+    # RETURNING is available from SQLite 3.35
+    supports_returning = sqlite3.sqlite_version_info >= (3, 35)
+
+    # Whether a writer set the journal mode up for the readers
+    _journal_mode_ready = False
+
+    def _connect(self):
+        connection = self._open_connection(self._db_name, self._get_writer_options())
+        self._track_journal_mode(connection)
+        return connection
+
+    def _track_journal_mode(self, connection):
+        # WAL reads never block a writer, and a write on the connection of an
+        # unfinished read would run on its old snapshot. Statements only share
+        # that connection on a rollback journal, where the read holds a lock.
+        journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+        self._pool.shares_borrowed = journal_mode != "wal"
+
+    def _get_writer_options(self):
+        options = self.get_options()
+
+        if self.has_readers:
+            # Readers only stop blocking the writer in WAL mode
+            options.setdefault("journal_mode", "WAL")
+
+        return options
+
+    def _connect_reader(self):
+        options = self.get_options()
+        # The journal mode is set by the writer and stored in the database file
+        options.pop("journal_mode", None)
+
+        if not self._journal_mode_ready:
+            self._set_up_journal_mode()
+
+        database = f"{Path(self._db_name).resolve().as_uri()}?mode=ro"
+        return self._open_connection(database, options, uri=True)
+
+    def _set_up_journal_mode(self):
+        # Read-only connections cannot change it, and a process that reads
+        # before it writes would otherwise keep the rollback journal
+        journal_mode = self._get_writer_options().get("journal_mode")
+
+        if journal_mode is not None:
+            if self.is_open:
+                self._set_journal_mode(self.get_connection(), journal_mode)
+            else:
+                with self._borrow_connection(self._pool) as connection:
+                    self._set_journal_mode(connection, journal_mode)
+
+        self._journal_mode_ready = True
+
+    def _set_journal_mode(self, connection, journal_mode):
+        connection.execute(f"PRAGMA journal_mode = {journal_mode}")
+        self._track_journal_mode(connection)
+
+    def _open_connection(self, database, options, uri=False):
+        # Pooled connections can move to another thread once released
+        connection = sqlite3.connect(
+            database,
+            check_same_thread=False,
+            cached_statements=options.pop(
+                "cached_statements", DEFAULT_CACHED_STATEMENTS
+            ),
+            uri=uri,
+        )
+
+        for name, value in options.items():
+            if isinstance(value, bool):
+                value = "ON" if value else "OFF"
+
+            connection.execute(f"PRAGMA {name} = {value}")
+
+        return connection
+
+    def get_options(self):
+        options = dict(settings.DATABASE_OPTIONS)
+        preset = options.pop("preset", None)
+
+        if preset is not None:
+            if preset not in OPTION_PRESETS:
+                raise OperationalError(
+                    f"{preset} is not a database options preset. "
+                    f"Options are {', '.join(OPTION_PRESETS)}."
+                )
+
+            options = {**OPTION_PRESETS[preset], **options}
+
+        for name in options:
+            if name not in PRAGMA_OPTIONS and name != "cached_statements":
+                raise OperationalError(f"{name} is not a supported database option.")
+
+        return options
+
+    def open(self):
+        self.get_connection()
+        return self
+
     def get_connection(self):
-        if self._connection is None:
-            self._connection = sqlite3.connect(self._db_name)
+        return self._get_pooled_connection(self._pool)
+
+    @property
+    def is_open(self):
+        return self._is_usable(self._pool)
+
+    def _get_pooled_connection(self, pool):
+        if not self._is_usable(pool):
+            return pool.acquire()
+
+        return pool.get_connection()
+
+    def _is_usable(self, pool):
+        connection = pool.get_connection()
+        if connection is None:
+            return False
+
+        try:
+            # Raises once the handle was closed, even if not through close()
+            connection.total_changes
+        except sqlite3.ProgrammingError:
+            pool.discard()
+            return False
+
+        return True
 
-        return self._connection
+    @contextmanager
+    def _borrow_connection(self, pool):
+        connection = pool.checkout()
+        try:
+            yield connection
+        finally:
+            pool.checkin(connection)
+
+    def _execute_borrowed(self, pool, method, statement, args, connection=None):
+        if connection is None:
+            connection = pool.checkout()
+
+        try:
+            cursor = connection.cursor(PooledCursor)
+            getattr(cursor, method)(statement, args)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            pool.checkin(connection)
+            raise
+
+        cursor.return_to(pool)
+        return cursor
 
     def execute(self, statement, args=()):
+        # Without a pinned connection, one is only borrowed for this statement
+        if not self.is_open:
+            return self._execute_borrowed(self._pool, "execute", statement, args)
+
         connection = self.get_connection()
         cursor = connection.cursor()
         data = cursor.execute(statement, args)
-        connection.commit()
+
+        if not self.in_atomic_block:
+            connection.commit()
 
         return data
 
+    def execute_read(self, statement, args=()):
+        # Inside a transaction, reads stay on the writer to see its own writes
+        if not self.has_readers or self.in_atomic_block:
+            return self.execute(statement, args)
+
+        # Readers are borrowed for the statement. When all of them are busy, an
+        # extra reader serves the read rather than making it wait. The writer
+        # would not do, a later write of the thread could reuse its snapshot.
+        connection = self._readers.checkout(overflow=True)
+
+        return self._execute_borrowed(
+            self._readers, "execute", statement, args, connection=connection
+        )
+
+    def execute_many(self, statement, args):
+        if not self.is_open:
+            return self._execute_borrowed(self._pool, "executemany", statement, args)
+
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        data = cursor.executemany(statement, args)
+
+        if not self.in_atomic_block:
+            connection.commit()
+
+        return data
+
+    @contextmanager
+    def atomic(self):
+        # The thread keeps the connection for the length of the transaction
+        pins_connection = not self.is_open
+        connection = self.get_connection()
+        savepoint = f"rogue_savepoint_{self._atomic_depth}"
+
+        if self.in_atomic_block:
+            connection.execute(f"SAVEPOINT {savepoint}")
+        else:
+            # Statements run outside of atomic are committed right away, so
+            # there is no implicit transaction left to merge with
+            connection.execute("BEGIN")
+
+        self._atomic_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._atomic_depth -= 1
+
+            if self.in_atomic_block:
+                connection.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                connection.execute(f"RELEASE SAVEPOINT {savepoint}")
+            else:
+                connection.rollback()
+
+            raise
+        else:
+            self._atomic_depth -= 1
+
+            if self.in_atomic_block:
+                connection.execute(f"RELEASE SAVEPOINT {savepoint}")
+            else:
+                connection.commit()
+        finally:
+            if pins_connection:
+                if connection.in_transaction:
+                    connection.rollback()
+
+                self._pool.release()
+
+    def get_max_variable_number(self):
+        # Connection.getlimit is only available from Python 3.11
+        if not hasattr(sqlite3.Connection, "getlimit"):
+            return DEFAULT_MAX_VARIABLE_NUMBER
+
+        if self.is_open:
+            return self.get_connection().getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+
+        with self._borrow_connection(self._pool) as connection:
+            return connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+
+    def release(self):
+        if self.in_atomic_block:
+            raise OperationalError("Cannot release the connection inside atomic.")
+
+        self._pool.release()
+
     def close(self):
-        self.get_connection().close()
+        if self.in_atomic_block:
+            raise OperationalError("Cannot close the connection inside atomic.")
+
+        # Readers go first, the last connection to close cleans up the WAL file
+        # and read-only ones cannot
+        for pool in (self._readers, self._pool):
+            pool.discard()
+            pool.close_idle()
+
+        # The next readers may open another file under the same name
+        self._journal_mode_ready = False
@@ -1,63 +1,194 @@
+from rogue.query import LOOKUP_SEPARATOR
+
 from ..base import BaseQueryBuilder
 from ..errors import OperationalError
 
 
 class QueryBuilder(BaseQueryBuilder):
+    IN_COMPARISONS = (
+        BaseQueryBuilder.COMPARISON_MAPPING[BaseQueryBuilder.IN],
+        BaseQueryBuilder.NOT_COMPARISON_MAPPING[BaseQueryBuilder.IN],
+    )
+
     def fetch_one(self):
-        data = self.client.execute(self._build_select()).fetchone()
+        data = self._read_one(*self._build_select())
         return self._format_output_data([data])
 
     def fetch_all(self):
-        data = self.client.execute(self._build_select()).fetchall()
+        data = self.client.execute_read(*self._build_select()).fetchall()
         return self._format_output_data(data)
 
+    def fetch_chunks(self, chunk_size):
+        cursor = self.client.execute_read(*self._build_select())
+
+        while True:
+            data = cursor.fetchmany(chunk_size)
+            if not data:
+                return
+
+            yield self._format_output_data(data)
+
+    def count(self):
+        return self._read_one(*self._build_count())[0]
+
+    def exists(self):
+        return self._read_one(*self._build_exists()) is not None
+
+    def _read_one(self, statement, args):
+        # Closing gives a borrowed connection back without waiting for the
+        # cursor to be collected
+        cursor = self.client.execute_read(statement, args)
+        try:
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+
     def insert(self, data):
-        self.client.execute(*self._build_insert(data))
-        data = (
-            self.__class__(self.client, self.model)
-            .where(
-                table_name=self.model.table_name,
-                field="id",
-                comparison=self.EQUAL,
-                value="(SELECT last_insert_rowid())",
-            )
-            .fetch_one()
-        )
-        return data
-
-    def update(self, pk, data):
-        self.client.execute(*self._build_update(pk, data))
-        data = (
-            self.__class__(self.client, self.model)
-            .where(
-                table_name=self.model.table_name,
-                field="id",
-                comparison=self.EQUAL,
-                value=pk,
+        statement, args = self._build_insert(data)
+
+        if not self.client.supports_returning:
+            cursor = self.client.execute(statement, args)
+            return [{**dict.fromkeys(self.fields), **data, "id": cursor.lastrowid}]
+
+        return self._execute_returning(statement, args)
+
+    def bulk_insert(self, rows, returning=True):
+        if not rows:
+            return []
+
+        headers = list(rows[0])
+        ids = []
+
+        with self.client.atomic():
+            for statement, args, row_count in self._build_bulk_insert(headers, rows):
+                self.client.execute_many(statement, args)
+
+                if not returning:
+                    continue
+
+                # Rows inserted in one transaction get consecutive ids, ending
+                # at last_insert_rowid() once the statement is done.
+                last_id = self.client.execute("SELECT last_insert_rowid()").fetchone()[
+                    0
+                ]
+                ids.extend(range(last_id - row_count + 1, last_id + 1))
+
+        if not returning:
+            return
+
+        if "id" in headers:
+            return [row["id"] for row in rows]
+
+        return ids
+
+    def update(self, data, returning=False):
+        statement, args = self._build_update(data)
+
+        if not returning:
+            return self.client.execute(statement, args).rowcount
+
+        if self.client.supports_returning:
+            return self._execute_returning(statement, args)
+
+        with self.client.atomic():
+            # Updated rows may no longer match the where, so they are re-selected by id
+            ids = [row["id"] for row in self.fetch_all()]
+            self.client.execute(statement, args)
+
+            return (
+                self.__class__(self.client, self.model)
+                .where(
+                    table_name=self.table_name,
+                    field="id",
+                    comparison=self.IN,
+                    value=ids,
+                )
+                .fetch_all()
             )
-            .fetch_one()
-        )
-        return data
 
     def delete(self):
         self.client.execute(*self._build_delete())
 
+    def _execute_returning(self, statement, args):
+        # The returned rows must be read before the statement is committed
+        with self.client.atomic():
+            data = self.client.execute(
+                f"{statement} {self._build_returning()}", args
+            ).fetchall()
+
+        return self._format_output_data(data)
+
     def _format_fields(self):
+        if self.selected_fields is not None:
+            return [*self.selected_fields.values(), *self.annotations.values()]
+
         fields = []
 
         for field in self.fields:
             fields.append(".".join((self.table_name, field)))
 
+        fields.extend(self.annotations.values())
+
+        for lookup, relation_descriptor in self.related_selections.items():
+            alias = self._get_related_alias(lookup)
+            for field in relation_descriptor.related_model.get_fields():
+                fields.append(".".join((alias, field)))
+
         return fields
 
-    def _build_select(self):
-        query = f"{self.SELECT} {', '.join(self._format_fields())} {self.FROM} {self.table_name}"
+    def _get_related_alias(self, lookup):
+        return f"_{lookup}__related"
+
+    def _build_select(self, fields=None):
+        fields = fields or self._format_fields()
+        query = f"{self.SELECT} {', '.join(fields)} {self.FROM} {self.table_name}"
 
+        joins = self._build_joins()
+        if joins:
+            query = f"{query} {joins}"
+
+        args = ()
         if self.where_statements:
-            query = f"{query} {self._build_where()}"
+            where, args = self._build_where()
+            query = f"{query} {where}"
+
+        if self.group_by_statements:
+            query = f"{query} {self.GROUP_BY} {', '.join(self.group_by_statements)}"
+
+        return self._add_order_by_and_limits(query), args
+
+    def _add_order_by_and_limits(self, query):
+        if self.order_by_statements:
+            query = f"{query} {self._build_order_by()}"
+
+        if self.is_sliced:
+            query = f"{query} {self._build_limits()}"
 
         return query
 
+    def _build_count(self):
+        if self.is_sliced or self.group_by_statements:
+            fields = None if self.group_by_statements else [f"{self.table_name}.id"]
+            query, args = self._build_select(fields)
+            return f"{self.SELECT} {self.COUNT_ALL} {self.FROM} ({query})", args
+
+        query = self.copy()
+        query.order_by_statements = []
+        return query._build_select([self.COUNT_ALL])
+
+    def _build_exists(self):
+        query = self.copy()
+
+        # Without a limit or offset, the order does not change whether a row exists
+        if not query.is_sliced:
+            query.order_by_statements = []
+
+        query.set_limits(0, 1)
+        return query._build_select(["1"])
+
+    def _build_returning(self):
+        return f"{self.RETURNING} {', '.join(self.fields)}"
+
     def _build_insert(self, data):
         assert not self.where_statements, "No where can be passed to an insert backend."
 
@@ -73,39 +204,179 @@ class QueryBuilder(BaseQueryBuilder):
             formatted_data,
         )
 
-    def _build_update(self, pk, data):
+    def _build_bulk_insert(self, headers, rows):
+        assert not self.where_statements, "No where can be passed to an insert backend."
+
+        if not headers:
+            statement = f"{self.INSERT} {self.table_name} DEFAULT {self.VALUES}"
+            return [(statement, [() for _ in rows], len(rows))]
+
+        # Pack as many rows per statement as the bound variable limit allows
+        rows_per_statement = max(
+            1, self.client.get_max_variable_number() // len(headers)
+        )
+        chunks = [
+            [
+                value
+                for row in rows[index : index + rows_per_statement]
+                for value in self._format_input_row(headers, row)
+            ]
+            for index in range(0, len(rows), rows_per_statement)
+        ]
+
+        statements = []
+        full_chunk_count, remainder = divmod(len(rows), rows_per_statement)
+
+        if full_chunk_count:
+            statements.append(
+                (
+                    self._build_multi_row_insert(headers, rows_per_statement),
+                    chunks[:full_chunk_count],
+                    full_chunk_count * rows_per_statement,
+                )
+            )
+
+        if remainder:
+            statements.append(
+                (
+                    self._build_multi_row_insert(headers, remainder),
+                    chunks[full_chunk_count:],
+                    remainder,
+                )
+            )
+
+        return statements
+
+    def _build_multi_row_insert(self, headers, row_count):
+        row_placeholder = f"({', '.join('?' for _ in headers)})"
+        return (
+            f"{self.INSERT} {self.table_name} ({', '.join(headers)}) {self.VALUES} "
+            f"{', '.join(row_placeholder for _ in range(row_count))}"
+        )
+
+    def _build_update(self, data):
         self._validate_data(data)
         headers, formatted_data = self._format_input_data(data)
 
         formatted_column_updates = [f"{col_name} = ?" for col_name in headers]
-
-        return (
-            f"{self.UPDATE} {self.table_name} SET {', '.join(formatted_column_updates)}",
-            formatted_data,
+        query = (
+            f"{self.UPDATE} {self.table_name} SET {', '.join(formatted_column_updates)}"
         )
 
+        if self.where_statements or self.is_sliced:
+            where, args = self._build_write_where()
+            query = f"{query} {where}"
+            formatted_data = [*formatted_data, *args]
+
+        return query, formatted_data
+
     def _build_delete(self):
         query = f"{self.DELETE} {self.FROM} {self.table_name}"
 
+        args = ()
+        if self.where_statements or self.is_sliced:
+            where, args = self._build_write_where()
+            query = f"{query} {where}"
+
+        return query, args
+
+    def _build_write_where(self):
+        joins = self._build_joins()
+        if not joins and not self.is_sliced:
+            return self._build_where()
+
+        # SQLite cannot join or limit in UPDATE and DELETE, so matching rows are selected in a subquery
+        query = f"{self.SELECT} {self.table_name}.id {self.FROM} {self.table_name}"
+        if joins:
+            query = f"{query} {joins}"
+
+        args = ()
         if self.where_statements:
-            query = f"{query} {self._build_where()}"
+            where, args = self._build_where()
+            query = f"{query} {where}"
 
-        return query, ()
+        query = self._add_order_by_and_limits(query)
+        return f"{self.WHERE} {self.table_name}.id IN ({query})", args
 
-    def _build_where(self):
-        wheres = []
-        joins = []
-        for where in self.where_statements:
-            if where.relation_descriptor:
-                for relation in where.relation_descriptor:
-                    joins.append(
-                        f"{self.INNER_JOIN} {relation['right_table_name']} {self.ON} "
+    def _build_joins(self):
+        joins = {}
+        # Rows without a match are filtered out by a where anyway, while
+        # selected columns must not drop rows with a null relation
+        relation_descriptors = [
+            *((where.relation_descriptor, False) for where in self.where_statements),
+            *((relation_join, True) for relation_join in self.relation_joins),
+        ]
+        for relation_descriptor, keep_nulls in relation_descriptors:
+            if relation_descriptor:
+                nullable = False
+
+                for relation in relation_descriptor:
+                    nullable = nullable or relation["nullable"]
+                    join_type = (
+                        self.LEFT_JOIN if keep_nulls and nullable else self.INNER_JOIN
+                    )
+                    condition = (
+                        f"{relation['right_table_name']} {self.ON} "
                         f"{relation['left_table_name']}.{relation['left_field_name']} = "
                         f"{relation['right_table_name']}.{relation['right_field_name']}"
                     )
+                    joins.setdefault(condition, f"{join_type} {condition}")
+
+        joins = list(joins.values())
+
+        for lookup, relation_descriptor in self.related_selections.items():
+            relations = list(relation_descriptor)
+            relation = relations[-1]
+
+            parent_lookup = lookup.rpartition(LOOKUP_SEPARATOR)[0]
+            left_table_name = (
+                self._get_related_alias(parent_lookup)
+                if parent_lookup
+                else self.table_name
+            )
+            alias = self._get_related_alias(lookup)
 
-            wheres.append(
-                f"{where.table_name}.{where.field} {where.comparison} {where.value}"
+            # A nullable relation anywhere in the path must not filter out the parent row
+            join_type = (
+                self.LEFT_JOIN
+                if any(path_relation["nullable"] for path_relation in relations)
+                else self.INNER_JOIN
             )
+            joins.append(
+                f"{join_type} {relation['right_table_name']} {alias} {self.ON} "
+                f"{left_table_name}.{relation['left_field_name']} = "
+                f"{alias}.{relation['right_field_name']}"
+            )
+
+        return " ".join(joins)
+
+    def _build_where(self):
+        wheres = []
+        args = []
+        for where in self.where_statements:
+            column = f"{where.table_name}.{where.field}"
+
+            if where.comparison in self.IN_COMPARISONS:
+                values = list(where.value)
+                wheres.append(
+                    f"{column} {where.comparison} ({', '.join('?' for _ in values)})"
+                )
+                args.extend(values)
+            else:
+                wheres.append(f"{column} {where.comparison} ?")
+                args.append(where.value)
+
+        return f"{self.WHERE} {f' {self.AND} '.join(wheres)}", tuple(args)
+
+    def _build_order_by(self):
+        order_by = [
+            f"{order.table_name}.{order.field} {self.DESC if order.descending else self.ASC}"
+            for order in self.order_by_statements
+        ]
+
+        return f"{self.ORDER_BY} {', '.join(order_by)}"
 
-        return f"{' '.join(joins)} {self.WHERE} {f' {self.AND} '.join(wheres)}"
+    def _build_limits(self):
+        # SQLite needs a LIMIT before an OFFSET, -1 meaning no limit
+        limit = -1 if self.limit is None else self.limit
+        return f"{self.LIMIT} {limit} {self.OFFSET} {self.offset}"
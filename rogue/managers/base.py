@@ -1,15 +1,21 @@
 from collections.abc import Iterable
+from copy import copy
 
 from rogue.backends.sqlite.client import DatabaseClient
 from rogue.backends.sqlite.query import QueryBuilder
-from rogue.query import Lookup, RelationDescriptor
+from rogue.query import (
+    Aggregate,
+    BatchGroup,
+    BatchMember,
+    LOOKUP_SEPARATOR,
+    Lookup,
+    RelationDescriptor,
+    get_identity_map,
+)
 
 from .errors import ManagerValidationError
 
 
-LOOKUP_SEPARATOR = "__"
-
-
 class Manager:
     def __init__(self, model_class, parent=None):
         self.model_class = model_class
@@ -23,12 +29,19 @@ class Manager:
         self._joins = {}
 
     def first(self):
-        if self._is_none:
+        # Filtering marks the manager of an unsaved model as none
+        obj = self._base_filtering()
+
+        if obj._is_none:
             return
 
-        self._base_filtering()
+        # Batched relations load every sibling at once rather than one row each
+        if obj._uses_cache():
+            results = obj._build_results(obj.all_data[:1])
+            return results[0] if results else None
 
-        data = self._build_models(self._query.fetch_one())
+        query = obj._query.copy().set_limits(0, 1)
+        data = obj._build_results(query.fetch_one())
         try:
             return data[0]
         except (IndexError, TypeError):
@@ -37,57 +50,307 @@ class Manager:
     def all(self):
         return self
 
+    async def afirst(self):
+        return await self.run_async(self.first)
+
+    async def aall(self):
+        return await self.run_async(list, self)
+
     def where(self, not_=False, table_name=None, **where):
         where = self._deconstruct_where(where)
         if where:
             # TODO: Filter the data instead of forcing a refetch
             self._cache = None
-            for lookup in where:
-                relation_descriptor = (
-                    RelationDescriptor(*lookup.tracking)
-                    if len(lookup.tracking) > 1
-                    else None
-                )
-                self._query = self._query.where(
-                    table_name=table_name or lookup.parent.get_query_table_name(),
-                    field=lookup.parent.name,
-                    comparison=lookup.comparison,
-                    value=lookup.value,
-                    not_=not_,
-                    relation_descriptor=relation_descriptor,
-                )
+            self._add_where(where, not_=not_, table_name=table_name)
         return self
 
+    def _add_where(self, where, not_=False, table_name=None):
+        for lookup in where:
+            relation_descriptor = (
+                RelationDescriptor(*lookup.tracking)
+                if len(lookup.tracking) > 1
+                else None
+            )
+            self._query = self._query.where(
+                table_name=table_name or lookup.parent.get_query_table_name(),
+                field=lookup.parent.name,
+                comparison=lookup.comparison,
+                value=lookup.value,
+                not_=not_,
+                relation_descriptor=relation_descriptor,
+            )
+
     def where_not(self, **where):
         return self.where(not_=True, **where)
 
+    def order_by(self, *fields):
+        self._cache = None
+        model_class = self.get_returned_model_class()
+
+        for field_name in fields:
+            descending = field_name.startswith("-")
+            field_name = field_name.removeprefix("-")
+
+            field = model_class.get_model_fields().get(field_name)
+            if field is None or hasattr(field, "_through_model"):
+                raise LookupError(
+                    f"{field_name} is not a field of {model_class.table_name}."
+                )
+
+            self._query.order_by(
+                table_name=model_class.table_name,
+                field=field.name,
+                descending=descending,
+            )
+
+        return self
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ManagerValidationError("Slicing does not support a step.")
+
+            start, stop = key.start, key.stop
+        elif isinstance(key, int):
+            start, stop = key, key + 1
+        else:
+            raise TypeError(
+                f"{self.__class__.__name__} indices must be integers or slices."
+            )
+
+        if any(bound is not None and bound < 0 for bound in (start, stop)):
+            raise ManagerValidationError("Negative indexing is not supported.")
+
+        if isinstance(key, int) and self._uses_cache():
+            # Only the requested row is built from the cache
+            data = self.all_data[key : key + 1]
+            if not data:
+                raise IndexError(f"{self.__class__.__name__} index out of range.")
+
+            return self._build_results(data)[0]
+
+        manager = self._get_sliced_copy()
+        manager._query.set_limits(start, stop)
+
+        if isinstance(key, slice):
+            return manager
+
+        results = manager.all_models
+        if not results:
+            raise IndexError(f"{self.__class__.__name__} index out of range.")
+
+        return results[0]
+
+    def _get_sliced_copy(self):
+        manager = copy(self)
+        manager._cache = None
+        return manager
+
+    def group_by(self, *lookups):
+        self._cache = None
+        self._query.related_selections = {}
+        self._query.select()
+
+        for lookup in lookups:
+            self._query.group_by(lookup, self._get_column(lookup))
+
+        return self
+
+    def annotate(self, **aggregates):
+        if not self._query.group_by_statements:
+            raise ManagerValidationError("annotate can only be called after group_by.")
+
+        self._cache = None
+        self._add_aggregates(aggregates)
+        return self
+
+    def aggregate(self, **aggregates):
+        obj = self._base_filtering()
+
+        if obj._query.is_sliced:
+            raise ManagerValidationError(
+                "aggregate cannot be used on a sliced manager."
+            )
+
+        if obj._is_empty():
+            return {
+                alias: aggregate.empty_value for alias, aggregate in aggregates.items()
+            }
+
+        manager = copy(obj)
+        manager._query.related_selections = {}
+        manager._query.order_by_statements = []
+        manager._query.group_by_statements = []
+        manager._query.annotations = {}
+        manager._query.selected_fields = {}
+        manager._add_aggregates(aggregates)
+
+        return manager._query.fetch_one()[0]
+
+    def _add_aggregates(self, aggregates):
+        for alias, aggregate in aggregates.items():
+            if not isinstance(aggregate, Aggregate):
+                raise ManagerValidationError(f"{alias} is not an aggregate.")
+
+            self._query.annotate(
+                **{alias: aggregate.as_sql(self._get_column(aggregate.lookup))}
+            )
+
+    def _get_column(self, lookup_str):
+        lookup = self._get_lookup_object(lookup_str, None)
+
+        if type(lookup) is not Lookup or hasattr(lookup.parent, "_through_model"):
+            raise LookupError(f"{lookup_str} does not point to a column.")
+
+        if len(lookup.tracking) > 1:
+            self._query.join(RelationDescriptor(*lookup.tracking))
+
+        return f"{lookup.parent.get_query_table_name()}.{lookup.parent.name}"
+
+    def values(self, *lookups):
+        self._cache = None
+        self._query.related_selections = {}
+        self._query.selected_fields = {}
+
+        for lookup in lookups or self.get_returned_model_class().get_field_names():
+            self._query.select(**{lookup: self._get_column(lookup)})
+
+        return self
+
+    def values_list(self, *lookups, flat=False):
+        if flat and len(lookups) != 1:
+            raise ManagerValidationError("flat can only be used with a single field.")
+
+        self.values(*lookups)
+        self._query.row_format = (
+            self._query.FLAT_ROWS if flat else self._query.TUPLE_ROWS
+        )
+        return self
+
+    def select_related(self, *lookups):
+        self._cache = None
+
+        for lookup in lookups:
+            model_class = self.get_returned_model_class()
+            field_names = lookup.split(LOOKUP_SEPARATOR)
+            tracking = []
+
+            for field_name in field_names:
+                field = model_class.get_model_fields().get(field_name)
+                if not hasattr(field, "_foreign_model") or hasattr(
+                    field, "_through_model"
+                ):
+                    raise LookupError(
+                        f"{field_name} is not a foreign key of {model_class.table_name}."
+                    )
+
+                tracking.append(field)
+                self._query.select_related(
+                    LOOKUP_SEPARATOR.join(field_names[: len(tracking)]),
+                    RelationDescriptor(*tracking),
+                )
+                model_class = field._foreign_model
+
+        return self
+
     def insert(self, data):
         self.validate_data(data)
-        return self._query.insert(data)[0]
+        return self._get_insert_query().insert(data)[0]
 
-    def update(self, pk, data):
-        self.validate_data(data)
-        return self._query.update(pk, data)[0]
+    def bulk_insert(self, rows, returning=True):
+        rows = list(rows)
+
+        for row in rows:
+            self.validate_data(row)
+
+            if row.keys() != rows[0].keys():
+                raise ManagerValidationError(
+                    "All rows passed to bulk_insert must define the same fields."
+                )
+
+            if "id" in row and row["id"] is None:
+                raise ManagerValidationError(
+                    "Rows passed to bulk_insert cannot define a null id."
+                )
+
+        return self._get_insert_query().bulk_insert(rows, returning=returning)
+
+    def _get_insert_query(self):
+        return self._query
+
+    def update(self, pk=None, data=None, /, *, returning=False, **values):
+        if pk is not None:
+            self.validate_data(data)
+            rows = self.where(id=pk)._query.update(data, returning=returning)
+            self._discard_from_identity_map(self.model_class, pk)
+
+            if returning:
+                return rows[0] if rows else None
+
+            return
+
+        if not values:
+            raise ManagerValidationError("update needs at least one field to set.")
+
+        self.validate_data(values, model_class=self.get_returned_model_class())
+
+        obj = self._base_filtering()
+        if obj._is_none:
+            return [] if returning else 0
+
+        obj._cache = None
+        rows = obj._query.update(values, returning=returning)
+        # The updated ids are not known, every loaded instance may be stale
+        self._discard_from_identity_map(self.get_returned_model_class())
+        return rows
 
     def delete(self, pk):
         self.where(id=pk)._query.delete()
+        self._discard_from_identity_map(self.model_class, pk)
+
+    def _discard_from_identity_map(self, model_class, pk=None):
+        # Later queries build fresh instances rather than return stale ones
+        identity_map = get_identity_map()
+        if identity_map is None:
+            return
+
+        if pk is None:
+            identity_map.discard_model(model_class)
+        else:
+            identity_map.discard(model_class, pk)
 
     def none(self):
         self._is_none = True
         return self
 
-    def validate_data(self, data):
+    def atomic(self):
+        return self._client.atomic()
+
+    async def run_async(self, func, *args):
+        return await self._client.run_async(func, *args)
+
+    def get_chunks(self, values, reserved=0):
+        # Keeps IN lists under the number of variables a statement can bind,
+        # reserved being the variables the rest of the statement uses
+        values = tuple(values)
+        size = max(1, self._client.get_max_variable_number() - reserved)
+
+        for index in range(0, len(values), size):
+            yield values[index : index + size]
+
+    def validate_data(self, data, model_class=None):
         if data is None:
             raise ManagerValidationError(
                 "The data argument must be passed for insert or update."
             )
 
-        model_fields = self.model_class.get_fields()
+        model_class = model_class or self.model_class
+        model_fields = model_class.get_fields()
 
         for field_name in data:
-            if field_name not in self.model_class.get_field_names():
+            if field_name not in model_class.get_field_names():
                 raise ManagerValidationError(
-                    f"{self.model_class.table_name} has no field named {field_name}."
+                    f"{model_class.table_name} has no field named {field_name}."
                 )
             model_fields[field_name].validate(data[field_name])
 
@@ -131,22 +394,63 @@ class Manager:
 
     def _build_models(self, data):
         models = []
+        related_rows = []
+        model_class = self.get_returned_model_class()
+        field_names = model_class.get_field_names()
+        identity_map = get_identity_map()
+
         for row in data:
-            row = self._build_relations(row)
-            model_class = self.get_returned_model_class()
-            models.append(model_class(id_=row.get("id"), parent=self, **row))
+            related_rows.append(row.get(self._query.RELATED_ROWS, {}))
+
+            # Rows already loaded in the identity map keep their instance
+            model = None
+            if identity_map is not None:
+                model = identity_map.get(model_class, row["id"])
+
+            if model is None:
+                model = model_class.from_db_row(
+                    [row[field_name] for field_name in field_names]
+                )
+
+                if identity_map is not None:
+                    identity_map.add(model)
+
+            models.append(model)
+
+        if self._query.related_selections:
+            self._build_related_models(models, related_rows)
+
+        batch_group = BatchGroup(models)
+        for model in models:
+            model._set_batch_group(batch_group)
 
         return models
 
-    def _build_relations(self, row):
-        for field_name, field in self.model_class.get_related_fields().items():
-            if field.name in row:
-                row[field_name] = row[field.name]
-            elif hasattr(field, "_through_model"):
-                relation_manager = field.get_relation_wrapper(field_name, None)
-                relation_manager.id = row.get("id")
-                row[field_name] = relation_manager
-        return row
+    def _build_related_models(self, models, related_rows):
+        built_models = {"": models}
+
+        for lookup, relation_descriptor in self._query.related_selections.items():
+            parent_lookup, _, field_name = lookup.rpartition(LOOKUP_SEPARATOR)
+
+            rows = {}
+            for related_row in related_rows:
+                row = related_row[lookup]
+                if row["id"] is not None:
+                    rows[row["id"]] = row
+
+            related_manager = Manager(relation_descriptor.related_model)
+            related_models = {
+                model.id: model
+                for model in related_manager._build_models(rows.values())
+            }
+
+            built_models[lookup] = []
+            for parent, related_row in zip(built_models[parent_lookup], related_rows):
+                related_model = related_models.get(related_row[lookup]["id"])
+                built_models[lookup].append(related_model)
+
+                if parent is not None:
+                    parent._get_relation(field_name).set_cache(related_model)
 
     def get_returned_model_class(self):
         return self.model_class
@@ -157,93 +461,364 @@ class Manager:
     def __iter__(self):
         return iter(self.all_models)
 
+    async def __aiter__(self):
+        for model in await self.aall():
+            yield model
+
+    def iterator(self, chunk_size=2000):
+        if chunk_size < 1:
+            raise ManagerValidationError("chunk_size must be a positive integer.")
+
+        obj = self._base_filtering()
+
+        if obj._is_empty():
+            return
+
+        # Rows are streamed from the cursor and never stored in _cache
+        for data in obj._query.fetch_chunks(chunk_size):
+            yield from obj._build_results(data)
+
     @property
     def all_data(self):
         obj = self._base_filtering()
 
-        if self._is_none or self.model_class.get_field_names() == ["id"]:
+        if obj._is_empty():
             return []
 
         if obj._cache is not None:
             data = obj._cache
         else:
-            data = obj._query.fetch_all()
+            data = obj._fetch_data()
             obj._cache = data
 
         return data
 
+    def _fetch_data(self):
+        return self._query.fetch_all()
+
     def _base_filtering(self):
         return self
 
     @property
     def all_models(self):
-        return self._build_models(self.all_data)
+        return self._build_results(self.all_data)
+
+    def _build_results(self, data):
+        # Grouped rows do not map to a model, so they are returned as dicts
+        if self._query.selected_fields is not None:
+            return data
+
+        return self._build_models(data)
 
     def __eq__(self, other):
         return self.all_data == other.all_data
 
+    def _is_empty(self):
+        return self._is_none or self.model_class.get_field_names() == ("id",)
+
+    def _uses_cache(self):
+        return self._cache is not None
+
+    def count(self):
+        obj = self._base_filtering()
+
+        if obj._is_empty():
+            return 0
+
+        if obj._uses_cache():
+            return len(obj.all_data)
+
+        return obj._query.count()
+
+    def exists(self):
+        obj = self._base_filtering()
+
+        if obj._is_empty():
+            return False
+
+        if obj._uses_cache():
+            return bool(obj.all_data)
+
+        return obj._query.exists()
+
     def __len__(self):
-        return len(list(self.__iter__()))
+        return self.count()
+
+    def __bool__(self):
+        # Truthiness is usually followed by iteration, so the results are loaded
+        # and cached. exists() checks without loading them.
+        return bool(self.all_data)
 
     def __contains__(self, other):
-        if not isinstance(other, self.model_class):
+        obj = self._base_filtering()
+
+        if obj._query.selected_fields is not None:
+            return other in obj.all_data
+
+        if not isinstance(other, self.get_returned_model_class()) or other.id is None:
             return False
 
-        for data in self.all_data:
-            if other.id == data["id"]:
-                return True
+        # A where added after a limit would apply before it, so sliced rows are loaded
+        if obj._uses_cache() or obj._query.is_sliced:
+            return any(other.id == data["id"] for data in obj.all_data)
+
+        return copy(obj).where(id=other.id).exists()
 
-        return False
+    def __copy__(self):
+        manager = self.__class__.__new__(self.__class__)
+        manager.__dict__.update(self.__dict__)
+        manager._query = self._query.copy()
+        return manager
 
     def __repr__(self):
         return f"<{self.__class__.__name__} [{', '.join(str(model) for model in self.all_models)}]>"
 
 
-class RelationManager(Manager):
+class RelationManager(Manager, BatchMember):
     def __init__(self, lookup_field, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.lookup_field = lookup_field
         self.id = None
 
+        self._is_filtered = False
+
+    def where(self, not_=False, table_name=None, **where):
+        # Once filtered further, this manager no longer matches its siblings' query
+        self.batch_group = None
+        return super().where(not_=not_, table_name=table_name, **where)
+
+    def order_by(self, *fields):
+        self.batch_group = None
+        return super().order_by(*fields)
+
+    def group_by(self, *lookups):
+        self.batch_group = None
+        return super().group_by(*lookups)
+
+    def values(self, *lookups):
+        self.batch_group = None
+        return super().values(*lookups)
+
+    def select_related(self, *lookups):
+        self.batch_group = None
+        return super().select_related(*lookups)
+
+    def _uses_cache(self):
+        # Loading the whole batch once is cheaper than a count per sibling, but
+        # a lone manager is better served by the query itself
+        return super()._uses_cache() or len(self._get_batch_managers()) > 1
+
+    def _get_sliced_copy(self):
+        manager = super()._get_sliced_copy()
+        manager.batch_group = None
+        return manager
+
     def _base_filtering(self):
         if self.id is None:
             return self.none()
 
-        return self.where(**{self.lookup_field: self.id})
+        if not self._is_filtered:
+            self._add_where(self._deconstruct_where({self.lookup_field: self.id}))
+            self._is_filtered = True
 
+        return self
 
-class ManyToManyManager(Manager):
-    def __init__(self, through_model, relation_model):
-        super().__init__(through_model)
-        self.lookup_field = None
-        self.id = None
+    def _get_batch_managers(self):
+        if self.batch_group is None:
+            return []
+
+        managers = [
+            manager
+            for manager in self.get_batch_siblings()
+            if manager.batch_group is self.batch_group
+            and manager.id is not None
+            and manager._cache is None
+        ]
+
+        # The group only holds weak references, the owner of this manager may
+        # have been collected while the manager is still in use
+        if (
+            self.id is not None
+            and self._cache is None
+            and not any(manager is self for manager in managers)
+        ):
+            managers.append(self)
+
+        return managers
+
+    def _fetch_data(self):
+        managers = self._get_batch_managers()
+
+        if len(managers) < 2:
+            return super()._fetch_data()
+
+        rows = {manager.id: [] for manager in managers}
+        for parent_id, row in self._fetch_batch(tuple(rows)):
+            rows[parent_id].append(row)
+
+        for manager in managers:
+            manager._cache = rows[manager.id]
+
+        return self._cache
+
+    def _fetch_batch(self, ids):
+        rows = []
+
+        for chunk in self.get_chunks(ids):
+            query = self._query.copy()
+            query.where_statements = []
+            data = query.where(
+                table_name=self.model_class.table_name,
+                field=self.lookup_field,
+                comparison=query.IN,
+                value=chunk,
+            ).fetch_all()
+
+            rows.extend((row[self.lookup_field], row) for row in data)
+
+        return rows
+
+
+class ManyToManyManager(RelationManager):
+    THROUGH_ID = "__through_id"
 
+    def __init__(self, through_model, relation_model):
+        super().__init__(None, through_model)
         self.relation_model = relation_model
 
+        self._query = QueryBuilder(self._client, self.relation_model)
+
+    def available_lookups(self):
+        return self.relation_model.available_lookups()
+
+    def _get_insert_query(self):
+        return self._get_through_query()
+
+    def _get_through_query(self):
+        return QueryBuilder(self._client, self.model_class)
+
     def _base_filtering(self):
         if self.id is None:
             return self.none()
 
-        self._query.model = self.relation_model
-        return self.where(table_name=self.get_query_table_name(), id=self.id)
+        if not self._is_filtered:
+            self._where_through(self._query.EQUAL, self.id)
+            self._is_filtered = True
+
+        return self
+
+    def _where_through(self, comparison, value, query=None):
+        if query is None:
+            query = self._query
+
+        through_field = self.model_class.get_model_fields()[
+            self.relation_model.table_name
+        ]
+
+        return query.where(
+            table_name=self.model_class.table_name,
+            field=self.lookup_field,
+            comparison=comparison,
+            value=value,
+            relation_descriptor=RelationDescriptor(through_field, reverse=True),
+        )
+
+    def _fetch_batch(self, ids):
+        rows = []
+
+        for chunk in self.get_chunks(ids):
+            query = self._query.copy()
+            query.where_statements = []
+            query.annotate(
+                **{
+                    self.THROUGH_ID: f"{self.model_class.table_name}.{self.lookup_field}"
+                }
+            )
+            data = self._where_through(query.IN, chunk, query=query).fetch_all()
+
+            rows.extend((row.pop(self.THROUGH_ID), row) for row in data)
+
+        return rows
 
     def add(self, data):
-        # TODO: Add a way to insert many with one query
-        if isinstance(data, Iterable):
-            all_data = []
-            for row in data:
-                insert_data = self._get_ids_from_row(row)
-                all_data.append(self.insert(insert_data))
-            return all_data
-
-        insert_data = self._get_ids_from_row(data)
-        return self.insert(insert_data)
-
-    def _get_ids_from_row(self, row):
-        if not row:
-            return {}
-
-        return {row.table_name + "_id": row.id, self.lookup_field: self.id}
+        self._add_ids(self._get_related_ids(data, save=True))
+
+    def remove(self, data):
+        self._remove_ids(self._get_related_ids(data))
+
+    def set(self, data):
+        with self.atomic():
+            related_ids = self._get_related_ids(data, save=True)
+            current_ids = [
+                row[self.relation_field]
+                for row in self._get_through_query()
+                .where(
+                    table_name=self.model_class.table_name,
+                    field=self.lookup_field,
+                    comparison=self._query.EQUAL,
+                    value=self.id,
+                )
+                .fetch_all()
+            ]
+
+            self._remove_ids([id_ for id_ in current_ids if id_ not in related_ids])
+            self._add_ids([id_ for id_ in related_ids if id_ not in current_ids])
+
+    @property
+    def relation_field(self):
+        return self.relation_model.table_name + "_id"
+
+    def _add_ids(self, related_ids):
+        if not related_ids:
+            return
+
+        self._cache = None
+        self.bulk_insert(
+            [
+                {self.relation_field: related_id, self.lookup_field: self.id}
+                for related_id in related_ids
+            ],
+            returning=False,
+        )
+
+    def _remove_ids(self, related_ids):
+        if not related_ids:
+            return
+
+        self._cache = None
+
+        with self.atomic():
+            # One variable is taken by the lookup on this manager's id
+            for chunk in self.get_chunks(related_ids, reserved=1):
+                query = self._get_through_query()
+                query.where(
+                    table_name=self.model_class.table_name,
+                    field=self.lookup_field,
+                    comparison=query.EQUAL,
+                    value=self.id,
+                ).where(
+                    table_name=self.model_class.table_name,
+                    field=self.relation_field,
+                    comparison=query.IN,
+                    value=chunk,
+                ).delete()
+
+    def _get_related_ids(self, data, save=False):
+        if not isinstance(data, Iterable):
+            data = [data]
+
+        related_ids = []
+        for model in data:
+            if model is None:
+                continue
+
+            if save and model.id is None:
+                model.save()
+
+            if model.id is not None and model.id not in related_ids:
+                related_ids.append(model.id)
+
+        return related_ids
 
     def get_returned_model_class(self):
         return self.relation_model
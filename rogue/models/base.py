@@ -1,16 +1,19 @@
-from copy import copy
+from functools import partial
+from types import MappingProxyType
 from typing import Any
 import re
 
 from rogue.managers import Manager, RelationManager, ManyToManyManager
+from rogue.query import BatchMember, get_identity_map
 from rogue.settings import settings
 
+from .errors import ModelValidationError
 from .fields import (
     BaseField,
     Field,
     RelationField,
     OneToOneWrapper,
-    BaseWrapper,
+    ReverseRelation,
     ManyToManyField,
 )
 
@@ -26,6 +29,7 @@ class ModelMeta(type):
         instance = super().__new__(cls, name, bases, namespace, **kwds)
 
         if name == "Model":
+            cls._set_meta(instance)
             return instance
 
         instance.table_name = cls._get_table_name(name)
@@ -44,8 +48,62 @@ class ModelMeta(type):
                 obj.default = namespace[name]
             setattr(instance, name, obj)
 
+        cls._set_meta(instance)
+        cls._set_hydrator(instance)
         return instance
 
+    @classmethod
+    def _set_meta(cls, model):
+        # Fields never change once the class is built, so these maps are
+        # computed once and frozen instead of rebuilt on every lookup
+        model_fields = {
+            field_name: field
+            for field_name, field in model.__dict__.items()
+            if isinstance(field, BaseField)
+        }
+        fields = {
+            field.name: field
+            for field in model_fields.values()
+            if field.name and not isinstance(field, ManyToManyField)
+        }
+        related_fields = {
+            field_name: field
+            for field_name, field in model_fields.items()
+            if isinstance(field, RelationField)
+        }
+
+        available_lookups = {}
+        for field_name, field in model_fields.items():
+            available_lookups[field_name] = field
+
+            if field.name != field_name:
+                available_lookups[field.name] = field
+
+        model._model_fields = MappingProxyType(model_fields)
+        model._fields = MappingProxyType(fields)
+        model._related_fields = MappingProxyType(related_fields)
+        model._available_lookups = MappingProxyType(available_lookups)
+        model._field_names = tuple(fields)
+
+    @classmethod
+    def _set_hydrator(cls, model):
+        # Rows from the database are already typed, so from_db_row assigns them
+        # positionally and skips __init__ with its cleaning and validation
+        targets = "".join(f"values[{name!r}], " for name in model._field_names)
+        source = (
+            "def from_db_row(model_class, row):\n"
+            "    instance = object.__new__(model_class)\n"
+            "    values = instance.__dict__\n"
+            "    values['_foreign_relations'] = {}\n"
+            f"    {targets}= row\n"
+            "    values['_Model__values_last_save'] = tuple(row)\n"
+            "    return instance\n"
+        )
+
+        namespace = {}
+        exec(source, namespace)
+        model.from_db_row = classmethod(namespace["from_db_row"])
+
     @classmethod
     def _get_table_name(cls, name):
         return "_".join(re.sub(r"([A-Z])", r" \1", name).split()).lower()
@@ -54,13 +112,13 @@ class ModelMeta(type):
 class Model(metaclass=ModelMeta):
     db_name = settings.DATABASE_NAME
 
-    def __init__(self, id_=None, parent=None, **kwargs):
-        self._parent = parent
+    _batch_group = None
 
+    def __init__(self, id_=None, **kwargs):
         self._foreign_relations = {}
 
-        self._set_related_managers()
-        self._set_related_managers_id(id_)
+        if id_ is not None:
+            kwargs.setdefault("id", id_)
 
         for field_name, field in self.get_model_fields().items():
             value = field.clean_value(kwargs.pop(field_name, None))
@@ -70,28 +128,57 @@ class Model(metaclass=ModelMeta):
             if field.name:
                 setattr(self, field.name, value)
 
-            foreign_relations = field.get_relation_wrapper(field.name, value)
-            if isinstance(foreign_relations, ManyToManyManager):
-                foreign_relations.id = id_
-                foreign_relations.lookup_field = self.table_name + "_id"
-            if foreign_relations is not None:
-                self._foreign_relations[field_name] = foreign_relations
-
         for attr, value in kwargs.items():
             setattr(self, attr, value)
 
-        self.__values_last_save = self.field_values
+        self._set_saved_values()
 
-    def _set_related_managers(self):
-        for field, manager in self.get_class_related_managers().items():
-            setattr(self, field, copy(manager))
+    def _set_saved_values(self):
+        # Values as of the last save, in the order of get_field_names()
+        self.__values_last_save = tuple(self.field_values.values())
 
     def _set_related_managers_id(self, id):
-        for manager in self.get_related_managers().values():
-            manager.id = id
+        for manager in self._foreign_relations.values():
+            if isinstance(manager, (RelationManager, OneToOneWrapper)):
+                manager.id = id
+
+    def _set_batch_group(self, batch_group):
+        self._batch_group = batch_group
 
-        for manager in self.get_many_managers().values():
-            manager.id = id
+        for field_name, relation in self._foreign_relations.items():
+            if isinstance(relation, BatchMember):
+                relation.set_batch_group(batch_group, field_name)
+
+    def _get_relation(self, name):
+        if name in self._foreign_relations:
+            return self._foreign_relations[name]
+
+        # Relations, reverse ones included, are only built once accessed
+        relation = self._build_relation(name)
+        if relation is not None:
+            self._foreign_relations[name] = relation
+
+        return relation
+
+    def _build_relation(self, name):
+        field = self.get_related_fields().get(name)
+        reverse_relation = type(self).__dict__.get(name)
+
+        if field is not None:
+            relation = field.get_relation_wrapper(name, self.__dict__.get(field.name))
+        elif isinstance(reverse_relation, ReverseRelation):
+            relation = reverse_relation.build_for_instance(self)
+        else:
+            return
+
+        if isinstance(relation, ManyToManyManager):
+            relation.id = self.__dict__.get("id")
+            relation.lookup_field = self.table_name + "_id"
+
+        if self._batch_group is not None and isinstance(relation, BatchMember):
+            relation.set_batch_group(self._batch_group, name)
+
+        return relation
 
     @classmethod
     def _get_new_manager(cls):
@@ -105,35 +192,96 @@ class Model(metaclass=ModelMeta):
         if self.id is None:
             created = True
             del field_values["id"]
-            new_values = manager.insert(field_values)
-            self.id = new_values["id"]
-            self.__values_last_save["id"] = self.id
-            self._set_related_managers_id(self.id)
-        else:
-            manager.update(self.id, self.get_changed_fields())
 
-        if created:
-            for field_name, field in self.get_many_managers().items():
-                if field_name in self.__dict__:
-                    value = self.__dict__.get(field_name)
-                    if value is not None:
-                        field.add(value)
+            with manager.atomic():
+                new_values = manager.insert(field_values)
+                self.id = new_values["id"]
+                self._set_related_managers_id(self.id)
+                self._save_many_relations()
+        else:
+            changed_fields = self.get_changed_fields()
+            if changed_fields:
+                manager.update(self.id, changed_fields)
 
-        if not created:
-            for field_name, value in field_values.items():
-                setattr(self, field_name, value)
-                self.__values_last_save[field_name] = value
+        # The update discarded the id from the identity map, the saved
+        # instance is the up to date one
+        identity_map = get_identity_map()
+        if identity_map is not None and (created or changed_fields):
+            identity_map.add(self)
 
+        self._set_saved_values()
         return created
 
+    async def asave(self):
+        return await self._get_new_manager().run_async(self.save)
+
+    def _save_many_relations(self):
+        for field_name, field in self.get_many_managers().items():
+            if field_name in self.__dict__:
+                value = self.__dict__.get(field_name)
+                if value is not None:
+                    field.add(value)
+
+    @classmethod
+    def bulk_create(cls, instances):
+        instances = list(instances)
+        rows = []
+
+        for instance in instances:
+            if not isinstance(instance, cls):
+                raise ModelValidationError(
+                    f"bulk_create on {cls.__name__} received a {type(instance).__name__}."
+                )
+
+            if instance.id is not None:
+                raise ModelValidationError(
+                    f"{instance} was already saved and cannot be bulk created."
+                )
+
+            field_values = instance.field_values
+            del field_values["id"]
+            rows.append(field_values)
+
+        manager = cls._get_new_manager()
+        with manager.atomic():
+            ids = manager.bulk_insert(rows)
+
+            for instance, id_ in zip(instances, ids):
+                instance.id = id_
+                instance._set_saved_values()
+                instance._set_related_managers_id(id_)
+                instance._save_many_relations()
+
+        return instances
+
     def delete(self):
         self._get_new_manager().delete(self.id)
+
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            identity_map.discard(type(self), self.id)
+
         self.id = None
 
+    @classmethod
+    def atomic(cls):
+        return cls._get_new_manager().atomic()
+
     @classmethod
     def get(cls, **kwargs):
+        identity_map = get_identity_map()
+
+        if identity_map is not None and kwargs.keys() == {"id"}:
+            instance = identity_map.get(cls, kwargs["id"])
+            if instance is not None:
+                return instance
+
         return cls._get_new_manager().where(**kwargs).first()
 
+    @classmethod
+    async def aget(cls, **kwargs):
+        return await cls._get_new_manager().run_async(partial(cls.get, **kwargs))
+
     @classmethod
     def where(cls, **kwargs):
         return cls._get_new_manager().where(**kwargs)
@@ -152,66 +300,43 @@ class Model(metaclass=ModelMeta):
 
     @classmethod
     def get_fields(cls):
-        return {
-            field.name: field
-            for field in cls.__dict__.values()
-            if isinstance(field, BaseField)
-            and field.name
-            and not isinstance(field, ManyToManyField)
-        }
+        return cls._fields
 
     @classmethod
     def get_model_fields(cls):
-        return {
-            field_name: field
-            for field_name, field in cls.__dict__.items()
-            if isinstance(field, BaseField)
-        }
+        return cls._model_fields
 
     @classmethod
     def available_lookups(cls):
-        available_lookups = {}
-
-        for field_name, field in cls.get_model_fields().items():
-            available_lookups[field_name] = field
-
-            if field.name != field_name:
-                available_lookups[field.name] = field
-
-        return available_lookups
+        return cls._available_lookups
 
     @classmethod
     def get_field_names(cls):
-        return list(cls.get_fields())
+        return cls._field_names
 
     @classmethod
     def get_related_fields(cls):
-        return {
-            field_name: field
-            for field_name, field in cls.get_model_fields().items()
-            if isinstance(field, RelationField)
-        }
+        return cls._related_fields
 
     @classmethod
     def get_class_related_managers(cls):
         return {
-            field_name: field
+            field_name: field.relation
             for field_name, field in cls.__dict__.items()
-            if isinstance(field, (RelationManager, OneToOneWrapper))
+            if isinstance(field, ReverseRelation)
         }
 
     def get_related_managers(self):
         return {
-            field_name: field
-            for field_name, field in self.__dict__.items()
-            if isinstance(field, (RelationManager, OneToOneWrapper))
+            field_name: self._get_relation(field_name)
+            for field_name in self.get_class_related_managers()
         }
 
     def get_many_managers(self):
         return {
-            field_name: field
-            for field_name, field in self.__dict__.get("_foreign_relations", {}).items()
-            if isinstance(field, ManyToManyManager)
+            field_name: self._get_relation(field_name)
+            for field_name, field in self.get_related_fields().items()
+            if isinstance(field, ManyToManyField)
         }
 
     @property
@@ -225,8 +350,10 @@ class Model(metaclass=ModelMeta):
     def get_changed_fields(self):
         changed_fields = {}
 
-        for field, value in self.field_values.items():
-            if value != self.__values_last_save.get(field):
+        for (field, value), saved_value in zip(
+            self.field_values.items(), self.__values_last_save
+        ):
+            if value != saved_value:
                 changed_fields[field] = value
 
         return changed_fields
@@ -239,19 +366,6 @@ class Model(metaclass=ModelMeta):
 
         super().__setattr__(attr, value)
 
-    def __getattribute__(self, name: str):
-        attribute = super().__getattribute__(name)
-
-        if name != "_foreign_relations" and name in getattr(
-            self, "_foreign_relations", []
-        ):
-            attribute = self._foreign_relations[name]
-
-        if isinstance(attribute, BaseWrapper):
-            return attribute()
-
-        return attribute
-
     def __eq__(self, obj: object) -> bool:
         return isinstance(obj, self.__class__) and obj.id == self.id
 
@@ -1,8 +1,9 @@
 from collections.abc import Iterable
+from copy import copy
 from typing import get_args
 
 from rogue.managers import RelationManager, ManyToManyManager
-from rogue.query import InLookup, Lookup
+from rogue.query import BatchMember, InLookup, Lookup, get_identity_map
 
 from .errors import FieldValidationError
 from .utils import get_through_model
@@ -133,23 +134,85 @@ class BaseWrapper:
     pass
 
 
-class ForeignKeyWrapper(BaseWrapper):
+class ReverseRelation:
+    # Set on the foreign model. Each instance gets its own copy of the
+    # relation, made the first time it is accessed.
+    def __init__(self, name, relation):
+        self.name = name
+        self.relation = relation
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        relation = instance._get_relation(self.name)
+        if isinstance(relation, BaseWrapper):
+            return relation()
+
+        return relation
+
+    def build_for_instance(self, instance):
+        relation = copy(self.relation)
+        relation.id = instance.__dict__.get("id")
+        return relation
+
+
+class ForeignKeyWrapper(BaseWrapper, BatchMember):
     def __init__(self, foreign_model, id):
         self._foreign_model = foreign_model
         self.id = id
 
         self._cache = None
+        self._is_fetched = False
 
     def __call__(self):
         if self.id is None:
             return None
 
-        if self._cache is not None:
-            return self._cache
+        if not self._is_fetched:
+            self._fetch_batch()
 
-        self._cache = self._foreign_model.get(id=self.id)
         return self._cache
 
+    def set_cache(self, model):
+        self._cache = model
+        self._is_fetched = True
+
+    def _fetch_batch(self):
+        wrappers = [
+            wrapper
+            for wrapper in self.get_batch_siblings()
+            if wrapper.id is not None and not wrapper._is_fetched
+        ]
+
+        identity_map = get_identity_map()
+        if identity_map is not None:
+            for wrapper in wrappers:
+                model = identity_map.get(self._foreign_model, wrapper.id)
+                if model is not None:
+                    wrapper.set_cache(model)
+
+            wrappers = [wrapper for wrapper in wrappers if not wrapper._is_fetched]
+
+        ids = {wrapper.id for wrapper in wrappers}
+
+        if not ids:
+            return
+
+        if len(ids) == 1:
+            models = [self._foreign_model.get(id=next(iter(ids)))]
+        else:
+            manager = self._foreign_model._get_new_manager()
+            models = [
+                model
+                for chunk in manager.get_chunks(ids)
+                for model in self._foreign_model.where(id__in=chunk)
+            ]
+
+        models_by_id = {model.id: model for model in models if model is not None}
+        for wrapper in wrappers:
+            wrapper.set_cache(models_by_id.get(wrapper.id))
+
 
 class ForeignKeyField(RelationField):
     PYTHON_TYPE = int
@@ -160,10 +223,10 @@ class ForeignKeyField(RelationField):
         field_name = self._get_field_name()
         super().__init__(parent, field_name, **kwargs)
 
-        reverse_relation_name = kwargs.get(
+        self.reverse_name = kwargs.get(
             "reverse_name", self._get_default_reverse_relation_name()
         )
-        self._set_reverse_relation(reverse_relation_name)
+        self._set_reverse_relation(self.reverse_name)
 
     def _set_reverse_relation(self, reverse_relation_name):
         if hasattr(self._foreign_model, reverse_relation_name):
@@ -175,7 +238,9 @@ class ForeignKeyField(RelationField):
         setattr(
             self._foreign_model,
             reverse_relation_name,
-            self._get_reverse_relation(self.name),
+            ReverseRelation(
+                reverse_relation_name, self._get_reverse_relation(self.name)
+            ),
         )
 
     def _get_field_name(self):
@@ -198,6 +263,17 @@ class ForeignKeyField(RelationField):
     def get_relation_wrapper(self, field_name, value):
         return ForeignKeyWrapper(self._foreign_model, value)
 
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        return instance._get_relation(self._model_field_name)()
+
+    def __set__(self, instance, value):
+        setattr(instance, self.name, self.clean_value(value))
+        # The wrapper is rebuilt for the new id on the next access
+        instance._foreign_relations.pop(self._model_field_name, None)
+
     def available_lookups(self):
         model_lookups = super().available_lookups()
 
@@ -237,10 +313,6 @@ class ManyToManyField(ForeignKeyField):
         # kwargs["nullable"] = True
         super().__init__(parent, field_name, foreign_model_class, **kwargs)
 
-        self.reverse_name = kwargs.get(
-            "reverse_name", self._get_default_reverse_relation_name()
-        )
-
         self._through_model = kwargs.get(
             "through",
             get_through_model(
@@ -266,6 +338,16 @@ class ManyToManyField(ForeignKeyField):
     def get_relation_wrapper(self, field_name, value):
         return ManyToManyManager(self._through_model, self._foreign_model)
 
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        return instance._get_relation(self._model_field_name)
+
+    def __set__(self, instance, value):
+        # Kept until the instance is saved, see Model._save_many_relations
+        instance.__dict__[self.name] = value
+
     def clean_value(self, value):
         if value is None:
             return
@@ -1,4 +1,23 @@
-from .query import Lookup, InLookup
+from .query import LOOKUP_SEPARATOR, Lookup, InLookup
 from .descriptors import RelationDescriptor
+from .batch import BatchGroup, BatchMember
+from .aggregates import Aggregate, Sum, Count, Avg, Min, Max
+from .identity import IdentityMap, get_identity_map, identity_map
 
-__all__ = ("Lookup", "InLookup", "RelationDescriptor")
+__all__ = (
+    "LOOKUP_SEPARATOR",
+    "Lookup",
+    "InLookup",
+    "RelationDescriptor",
+    "BatchGroup",
+    "BatchMember",
+    "Aggregate",
+    "Sum",
+    "Count",
+    "Avg",
+    "Min",
+    "Max",
+    "IdentityMap",
+    "get_identity_map",
+    "identity_map",
+)
@@ -0,0 +1,34 @@
+class Aggregate:
+    function = None
+    empty_value = None
+
+    def __init__(self, lookup, distinct=False):
+        self.lookup = lookup
+        self.distinct = distinct
+
+    def as_sql(self, column):
+        if self.distinct:
+            column = f"DISTINCT {column}"
+
+        return f"{self.function}({column})"
+
+
+class Sum(Aggregate):
+    function = "SUM"
+
+
+class Count(Aggregate):
+    function = "COUNT"
+    empty_value = 0
+
+
+class Avg(Aggregate):
+    function = "AVG"
+
+
+class Min(Aggregate):
+    function = "MIN"
+
+
+class Max(Aggregate):
+    function = "MAX"
@@ -0,0 +1,39 @@
+from weakref import ref
+
+
+class BatchGroup:
+    # Instances built from the same result set. Relations are fetched for
+    # every instance of the group the first time one of them is accessed.
+    def __init__(self, instances):
+        self._instances = [ref(instance) for instance in instances]
+
+    def __iter__(self):
+        for instance_ref in self._instances:
+            instance = instance_ref()
+            if instance is not None:
+                yield instance
+
+    def get_relations(self, name):
+        relations = []
+
+        for instance in self:
+            relation = instance._get_relation(name)
+            if relation is not None:
+                relations.append(relation)
+
+        return relations
+
+
+class BatchMember:
+    batch_group = None
+    batch_name = None
+
+    def set_batch_group(self, batch_group, batch_name):
+        self.batch_group = batch_group
+        self.batch_name = batch_name
+
+    def get_batch_siblings(self):
+        if self.batch_group is None:
+            return [self]
+
+        return self.batch_group.get_relations(self.batch_name)
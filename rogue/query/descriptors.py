@@ -1,20 +1,39 @@
 class RelationDescriptor:
-    def __init__(self, *trackings):
+    def __init__(self, *trackings, reverse=False):
         from rogue.models.fields import RelationField
 
         self._trackings = trackings
+        self._reverse = reverse
         self._formatted_trackings = []
 
         for tracking in self._trackings:
             if isinstance(tracking, RelationField):
-                self._formatted_trackings.append(
-                    {
-                        "left_table_name": tracking._parent.table_name,
-                        "left_field_name": tracking.name,
-                        "right_table_name": tracking._foreign_model.table_name,
-                        "right_field_name": "id",
-                    }
-                )
+                self._formatted_trackings.append(self._format_tracking(tracking))
+
+    def _format_tracking(self, tracking):
+        if self._reverse:
+            return {
+                "left_table_name": tracking._foreign_model.table_name,
+                "left_field_name": "id",
+                "right_table_name": tracking._parent.table_name,
+                "right_field_name": tracking.name,
+                "nullable": tracking.nullable,
+            }
+
+        return {
+            "left_table_name": tracking._parent.table_name,
+            "left_field_name": tracking.name,
+            "right_table_name": tracking._foreign_model.table_name,
+            "right_field_name": "id",
+            "nullable": tracking.nullable,
+        }
+
+    @property
+    def related_model(self):
+        if self._reverse:
+            return self._trackings[-1]._parent
+
+        return self._trackings[-1]._foreign_model
 
     def __iter__(self):
         return iter(self._formatted_trackings)
@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from weakref import WeakValueDictionary
+
+
+_current_identity_map = ContextVar("identity_map", default=None)
+
+
+class IdentityMap:
+    # Instances loaded while the map is active, keyed by (model class, id).
+    # Only weak references are kept, so instances nobody uses are collected.
+    def __init__(self):
+        self._instances = WeakValueDictionary()
+
+    def get(self, model_class, id):
+        return self._instances.get((model_class, id))
+
+    def add(self, instance):
+        if instance.id is not None:
+            self._instances[(type(instance), instance.id)] = instance
+
+    def discard(self, model_class, id):
+        self._instances.pop((model_class, id), None)
+
+    def discard_model(self, model_class):
+        for key in list(self._instances.keys()):
+            if key[0] is model_class:
+                self._instances.pop(key, None)
+
+    def __len__(self):
+        return len(self._instances)
+
+
+def get_identity_map():
+    return _current_identity_map.get()
+
+
+@contextmanager
+def identity_map():
+    # Nested blocks share the map of the outermost one
+    current = get_identity_map()
+    if current is not None:
+        yield current
+        return
+
+    token = _current_identity_map.set(IdentityMap())
+    try:
+        yield get_identity_map()
+    finally:
+        _current_identity_map.reset(token)
@@ -1,3 +1,6 @@
+LOOKUP_SEPARATOR = "__"
+
+
 class Lookup:
     comparison = "equal"
 
@@ -1,4 +1,22 @@
 DATABASE_NAME = "default.sqlite"
 DATABASE_ENGINE = "sqlite"
 
+# Connections are borrowed for a single statement, or kept by a thread for the
+# length of a transaction, so the pool can be smaller than the thread count.
+DATABASE_POOL_SIZE = 8
+DATABASE_POOL_IDLE_TIMEOUT = 300
+DATABASE_POOL_TIMEOUT = 30
+
+# Number of read-only connections used for queries outside of transactions.
+# 0 sends every query through the writer connections.
+DATABASE_READERS = 0
+
+# Number of threads running the queries of the async API (afirst, aall, ...).
+DATABASE_ASYNC_WORKERS = 4
+
+# Applied to every new connection. "preset" picks one of "throughput",
+# "durable" or "readonly", and any other key overrides the preset, e.g.
+# {"preset": "throughput", "cache_size": -16384}
+DATABASE_OPTIONS = {}
+
 MODELS_FOLDER = "models"
@@ -1,7 +1,12 @@
-import os
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
+from unittest.mock import patch
+import os
+import sqlite3
+import threading
 from sqlite3 import Connection as SqliteConnection, Cursor as SqliteCursor
 
+from rogue.backends.errors import OperationalError
 from rogue.backends.sqlite.client import DatabaseClient
 from rogue.settings import settings
 
@@ -14,6 +19,236 @@ class DatabaseClientTestCase(TestCase):
         connection = self.database_client.get_connection()
         self.assertIsInstance(connection, SqliteConnection)
 
+    def test_connection_lifecycle(self):
+        connection = self.database_client.get_connection()
+        self.assertIs(DatabaseClient().get_connection(), connection)
+
+        # A handle closed behind the client's back is reopened
+        connection.close()
+        self.assertFalse(self.database_client.is_open)
+        self.assertIsNot(self.database_client.get_connection(), connection)
+
+        with DatabaseClient() as database_client:
+            self.assertIs(database_client, self.database_client)
+            self.assertTrue(database_client.is_open)
+
+            with self.assertRaises(OperationalError):
+                with database_client.atomic():
+                    database_client.close()
+
+        self.assertFalse(self.database_client.is_open)
+        self.assertTrue(self.database_client.open().is_open)
+
+    def test_connection_pool(self):
+        connection = self.database_client.get_connection()
+        connections = {}
+        in_atomic_block = {}
+
+        def use_connection(name):
+            connections[name] = self.database_client.get_connection()
+            in_atomic_block[name] = self.database_client.in_atomic_block
+            self.database_client.release()
+
+        with self.database_client.atomic():
+            thread = threading.Thread(target=use_connection, args=("first",))
+            thread.start()
+            thread.join()
+
+        self.assertIsNot(connections["first"], connection)
+        self.assertFalse(in_atomic_block["first"])
+
+        # Released connections are reused by the next thread
+        thread = threading.Thread(target=use_connection, args=("second",))
+        thread.start()
+        thread.join()
+        self.assertIs(connections["second"], connections["first"])
+
+        pool = self.database_client._pool
+        with patch.object(pool, "max_size", 2), patch.object(pool, "timeout", 0):
+            thread = threading.Thread(target=self.database_client.get_connection)
+            thread.start()
+            thread.join()
+
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # The connection of a thread that ended without releasing it is taken back
+                executor.submit(self.database_client.get_connection).result()
+                self.assertEqual(pool.size, 2)
+
+                with self.assertRaises(OperationalError):
+                    with ThreadPoolExecutor(max_workers=1) as other_executor:
+                        other_executor.submit(
+                            self.database_client.get_connection
+                        ).result()
+
+                executor.submit(self.database_client.release).result()
+
+        with patch.object(pool, "idle_timeout", 0):
+            self.database_client.release()
+            self.database_client.get_connection()
+            self.assertEqual(pool.size, 1)
+
+    def test_connections_are_borrowed_per_statement(self):
+        self.database_client.close()
+        self.database_client.execute(
+            "CREATE TABLE test_client (test_column integer PRIMARY KEY);"
+        )
+        pool = self.database_client._pool
+        barrier = threading.Barrier(4, timeout=5)
+
+        def run_statements(value):
+            # Every worker is alive at once and never releases anything
+            barrier.wait()
+            self.database_client.execute(
+                "INSERT INTO test_client (test_column) VALUES(?)", (value,)
+            )
+            self.database_client.execute("SELECT * FROM test_client;").fetchone()
+            return self.database_client.execute(
+                "SELECT COUNT(*) FROM test_client;"
+            ).fetchall()
+
+        with patch.object(pool, "max_size", 2), patch.object(pool, "timeout", 5):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(run_statements, range(8)))
+
+            self.assertLessEqual(pool.size, 2)
+            self.assertFalse(pool._borrowed)
+            self.assertFalse(pool._checked_out)
+
+            # Transactions keep their connection until they end
+            with self.database_client.atomic():
+                connection = self.database_client.get_connection()
+                self.assertIs(pool.get_connection(), connection)
+            self.assertIsNone(pool.get_connection())
+
+        self.assertEqual(
+            self.database_client.execute(
+                "SELECT COUNT(*) FROM test_client;"
+            ).fetchone(),
+            (8,),
+        )
+
+    def test_database_options(self):
+        self.database_client.close()
+
+        options = {"preset": "throughput", "cache_size": -1024}
+        with patch.object(settings, "DATABASE_OPTIONS", options):
+            connection = self.database_client.get_connection()
+
+        pragmas = {
+            name: connection.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in ("journal_mode", "synchronous", "cache_size", "temp_store")
+        }
+        self.assertEqual(
+            pragmas,
+            {
+                "journal_mode": "wal",
+                "synchronous": 1,
+                "cache_size": -1024,
+                "temp_store": 2,
+            },
+        )
+
+        self.database_client.close()
+        with patch.object(settings, "DATABASE_OPTIONS", {"preset": "readonly"}):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.database_client.execute("CREATE TABLE test_client (id integer);")
+
+            self.database_client.close()
+            with patch.object(settings, "DATABASE_OPTIONS", {"wrong_option": 1}):
+                with self.assertRaises(OperationalError):
+                    self.database_client.get_connection()
+
+    def test_read_connections(self):
+        self.database_client.close()
+        statement = "INSERT INTO test_client (test_column) VALUES(?)"
+
+        with patch.object(self.database_client._readers, "max_size", 2):
+            # Reading first still sets up WAL before any reader opens
+            cursor = self.database_client.execute_read("PRAGMA journal_mode;")
+            self.assertEqual(cursor.fetchall(), [("wal",)])
+            self.database_client.close()
+
+            writer = self.database_client.get_connection()
+            writer.execute(
+                "CREATE TABLE test_client (test_column integer PRIMARY KEY);"
+            )
+            self.assertEqual(writer.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+            self.database_client.execute(statement, (1,))
+            cursor = self.database_client.execute_read("SELECT * FROM test_client;")
+            self.assertIsNot(cursor.connection, writer)
+            self.assertEqual(cursor.fetchall(), [(1,)])
+
+            readers = self.database_client._readers
+            with self.database_client._borrow_connection(readers) as reader:
+                with self.assertRaises(sqlite3.OperationalError):
+                    reader.execute(statement, (2,))
+
+            # Uncommitted writes are only visible on the writer
+            with self.database_client.atomic():
+                self.database_client.execute(statement, (3,))
+                cursor = self.database_client.execute_read("SELECT * FROM test_client;")
+                self.assertIs(cursor.connection, writer)
+                self.assertEqual(cursor.fetchall(), [(1,), (3,)])
+
+            self.database_client.close()
+
+        # Readers are not kept by the threads that used them
+        barrier = threading.Barrier(4, timeout=5)
+
+        def read(_):
+            barrier.wait()
+            return [
+                self.database_client.execute_read(
+                    "SELECT COUNT(*) FROM test_client;"
+                ).fetchone()[0]
+                for _ in range(3)
+            ]
+
+        with patch.object(self.database_client._readers, "max_size", 1):
+            self.database_client.execute_read("SELECT * FROM test_client;").fetchone()
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                counts = list(executor.map(read, range(4)))
+
+            self.assertEqual(counts, [[2, 2, 2]] * 4)
+            self.assertEqual(self.database_client._readers.size, 1)
+            self.assertFalse(self.database_client._readers._borrowed)
+
+            # With every reader busy, reads still stay off the writers
+            reading = threading.Event()
+            done = threading.Event()
+
+            def hold_reader():
+                cursor = self.database_client.execute_read("SELECT * FROM test_client;")
+                cursor.fetchone()
+                reading.set()
+                done.wait(5)
+                cursor.fetchall()
+
+            thread = threading.Thread(target=hold_reader)
+            thread.start()
+            reading.wait(5)
+
+            cursor = self.database_client.execute_read("SELECT * FROM test_client;")
+            self.assertEqual(cursor.fetchone(), (1,))
+            self.assertFalse(self.database_client._pool._borrowed)
+
+            writer = threading.Thread(
+                target=self.database_client.execute, args=(statement, (4,))
+            )
+            writer.start()
+            writer.join()
+            self.database_client.execute(statement, (5,))
+
+            self.assertEqual(cursor.fetchall(), [(3,)])
+            done.set()
+            thread.join()
+            self.assertEqual(self.database_client._readers.size, 1)
+            self.assertFalse(self.database_client._readers._overflow)
+
+            self.database_client.close()
+
     def test_execute(self):
         statement = "CREATE TABLE test_client (test_column integer PRIMARY KEY);"
         response = self.database_client.execute(statement)
@@ -28,6 +263,38 @@ class DatabaseClientTestCase(TestCase):
         response = self.database_client.execute(statement)
         self.assertIsInstance(response, SqliteCursor)
 
+    def test_atomic(self):
+        self.database_client.execute(
+            "CREATE TABLE test_client (test_column integer PRIMARY KEY);"
+        )
+        statement = "INSERT INTO test_client (test_column) VALUES(?)"
+
+        with self.database_client.atomic():
+            self.database_client.execute(statement, (1,))
+            self.assertTrue(self.database_client.get_connection().in_transaction)
+
+            with self.assertRaises(ValueError):
+                with self.database_client.atomic():
+                    self.database_client.execute(statement, (2,))
+                    raise ValueError
+
+        with self.assertRaises(ValueError):
+            with self.database_client.atomic():
+                self.database_client.execute(statement, (3,))
+                raise ValueError
+
+        @self.database_client.atomic()
+        def insert(value):
+            self.database_client.execute(statement, (value,))
+
+        insert(4)
+
+        self.assertFalse(self.database_client.get_connection().in_transaction)
+        self.assertEqual(
+            self.database_client.execute("SELECT * FROM test_client;").fetchall(),
+            [(1,), (4,)],
+        )
+
     def tearDown(self) -> None:
         self.database_client.close()
         os.remove(settings.DATABASE_NAME)
@@ -1,10 +1,18 @@
-from unittest import TestCase
+from unittest.mock import patch
+import asyncio
+import gc
+import threading
 
 from rogue.models import Model, Field
-from rogue.backends.sqlite.client import DatabaseClient
+from rogue.backends.errors import OperationalError
+from rogue.backends.sqlite.client import DatabaseClient, PooledCursor
+from rogue.managers import Manager
 from rogue.managers.errors import ManagerValidationError
+from rogue.query import Avg, Count, Max, Sum, identity_map
 from rogue.settings import settings
 
+from ..utils import QueryTestCase
+
 
 class TestManager(Model):
     test: Field[int | None]
@@ -14,7 +22,11 @@ class TestModel(Model):
     test_manager: Field[TestManager]
 
 
-class ManagerTestCase(TestCase):
+class TestRelatedModel(Model):
+    test_model: Field[TestModel | None]
+
+
+class ManagerTestCase(QueryTestCase):
     def setUp(self):
         self.client = DatabaseClient(settings.DATABASE_NAME)
         self.client.execute(
@@ -23,6 +35,9 @@ class ManagerTestCase(TestCase):
         self.client.execute(
             "CREATE TABLE test_model (id integer PRIMARY KEY autoincrement, test_manager_id integer);"
         )
+        self.client.execute(
+            "CREATE TABLE test_related_model (id integer PRIMARY KEY autoincrement, test_model_id integer);"
+        )
         self.test_model = TestManager()
         self.manager = self.test_model._get_new_manager()
 
@@ -36,16 +51,68 @@ class ManagerTestCase(TestCase):
             self.manager.insert({"wrong_field": 5})
 
     def test_insert(self):
-        new_model = self.manager.insert({"test": 5})
-        self.assertEqual(new_model["test"], 5)
+        with self.assertNumQueries(1):
+            new_model = self.manager.insert({"test": 5})
+
+        self.assertEqual(new_model, {"id": 1, "test": 5})
+
+        with patch.object(self.client, "supports_returning", False):
+            self.assertEqual(self.manager.insert({}), {"id": 2, "test": None})
+
+    def test_bulk_insert(self):
+        with self.assertRaises(ManagerValidationError):
+            self.manager.bulk_insert([{"test": 1}, {}])
+
+        with patch.object(self.client, "get_max_variable_number", return_value=2):
+            ids = self.manager.bulk_insert([{"test": value} for value in range(5)])
+
+        self.assertEqual(ids, [1, 2, 3, 4, 5])
+        self.assertEqual(
+            self.client.execute("SELECT id, test FROM test_manager;").fetchall(),
+            [(1, 0), (2, 1), (3, 2), (4, 3), (5, 4)],
+        )
+
+        self.assertEqual(self.manager.bulk_insert([{}, {}]), [6, 7])
 
     def test_update(self):
         self.client.execute("INSERT INTO test_manager (test) VALUES (0);")
         id_ = self.client.execute(
             "SELECT id FROM test_manager WHERE test = 0;"
         ).fetchone()[0]
-        new_model = self.manager.update(id_, {"test": 5})
-        self.assertEqual(new_model["test"], 5)
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.manager.update(id_, {"test": 5}))
+
+        new_model = self.manager.update(id_, {"test": 6}, returning=True)
+        self.assertEqual(new_model, {"id": id_, "test": 6})
+
+        with patch.object(self.client, "supports_returning", False):
+            self.assertEqual(
+                TestManager.where(test=6).update(test=7, returning=True),
+                [{"id": id_, "test": 7}],
+            )
+
+    def test_update_where(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2), (1);")
+        self.client.execute(
+            "INSERT INTO test_model (test_manager_id) VALUES (1), (2), (3);"
+        )
+
+        with self.assertRaises(ManagerValidationError):
+            TestManager.where(test=1).update()
+
+        self.assertEqual(TestManager.where(test=1).update(test=5), 2)
+        self.assertEqual(
+            TestModel.where(test_manager__test=2).update(test_manager_id=3), 1
+        )
+
+        self.assertEqual(
+            self.client.execute("SELECT test FROM test_manager;").fetchall(),
+            [(5,), (2,), (5,)],
+        )
+        self.assertEqual(
+            self.client.execute("SELECT test_manager_id FROM test_model;").fetchall(),
+            [(1,), (3,), (3,)],
+        )
 
     def test_repr_works(self):
         str(self.manager)
@@ -86,9 +153,436 @@ class ManagerTestCase(TestCase):
         for model in manager:
             self.assertEqual(model.test_manager.test, 2)
 
+    def test_where_uses_bound_parameters(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2), (3);")
+
+        first_query, first_args = TestManager.where(test=1)._query._build_select()
+        second_query, second_args = TestManager.where(test=2)._query._build_select()
+        self.assertEqual(first_query, second_query)
+        self.assertEqual((first_args, second_args), ((1,), (2,)))
+
+        self.assertEqual([model.test for model in TestManager.where(test__in=[3])], [3])
+        self.assertEqual(len(TestManager.where(test="1 OR 1 = 1")), 0)
+
+    def test_foreign_keys_are_fetched_in_batch(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2), (3);")
+        self.client.execute(
+            "INSERT INTO test_model (test_manager_id) VALUES (1), (2), (3), (1);"
+        )
+
+        models = list(TestModel.all())
+        with self.assertNumQueries(1):
+            values = [model.test_manager.test for model in models]
+
+        self.assertEqual(values, [1, 2, 3, 1])
+        self.assertIs(models[0].test_manager, models[3].test_manager)
+
+        # The ids are split to stay under the bound variable limit
+        models = list(TestModel.all())
+        with patch.object(self.client, "get_max_variable_number", return_value=2):
+            with self.assertNumQueries(2):
+                values = [model.test_manager.test for model in models]
+
+        self.assertEqual(values, [1, 2, 3, 1])
+
+    def test_reverse_relations_are_fetched_in_batch(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2), (3);")
+        self.client.execute(
+            "INSERT INTO test_model (test_manager_id) VALUES (1), (2), (1);"
+        )
+
+        models = list(TestManager.all())
+        with self.assertNumQueries(1):
+            values = [
+                [test_model.id for test_model in model.test_model_set]
+                for model in models
+            ]
+
+        self.assertEqual(values, [[1, 3], [2], []])
+
+        models = list(TestManager.all())
+        with patch.object(self.client, "get_max_variable_number", return_value=2):
+            with self.assertNumQueries(2):
+                values = [
+                    [test_model.id for test_model in model.test_model_set]
+                    for model in models
+                ]
+
+        self.assertEqual(values, [[1, 3], [2], []])
+
+        models = list(TestManager.all())
+        with self.assertNumQueries(1):
+            values = [model.test_model_set.first() for model in models]
+            self.assertEqual(models[1].test_model_set[0].id, 2)
+
+            with self.assertRaises(IndexError):
+                models[2].test_model_set[0]
+
+        self.assertEqual([value and value.id for value in values], [1, 2, None])
+
+        test_manager = TestManager.get(id=1)
+        with self.assertNumQueries() as queries:
+            self.assertEqual(test_manager.test_model_set.first().id, 1)
+            self.assertEqual(test_manager.test_model_set[1].id, 3)
+        self.assertTrue(all("LIMIT 1" in query for query in queries))
+
+        # A manager whose model was collected still loads with its siblings
+        models = list(TestManager.all())
+        managers = [model.test_model_set for model in models]
+        del models[0]
+        gc.collect()
+        with self.assertNumQueries(1):
+            self.assertEqual(managers[0].count(), 2)
+            self.assertEqual([model.id for model in managers[0]], [1, 3])
+            self.assertEqual(managers[1].first().id, 2)
+
+        manager = TestModel.all()
+        list(manager)
+        with patch.object(
+            TestModel, "from_db_row", wraps=TestModel.from_db_row
+        ) as from_db_row:
+            self.assertEqual(manager[2].id, 3)
+        self.assertEqual(from_db_row.call_count, 1)
+
+    def test_relations_are_built_on_access(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2);")
+        self.client.execute("INSERT INTO test_model (test_manager_id) VALUES (2);")
+
+        models = list(TestManager.all())
+        self.assertEqual([model._foreign_relations for model in models], [{}, {}])
+        self.assertNotIn("_parent", models[0].__dict__)
+
+        self.assertIs(models[1].test_model_set, models[1].test_model_set)
+        self.assertEqual(list(models[1]._foreign_relations), ["test_model_set"])
+        self.assertEqual([model.id for model in models[1].test_model_set], [1])
+        self.assertEqual(len(models[0].test_model_set), 0)
+
+    def test_iterator(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2), (3);")
+        self.client.execute(
+            "INSERT INTO test_model (test_manager_id) VALUES (1), (2), (3), (1), (2);"
+        )
+
+        manager = TestModel.all()
+        with self.assertNumQueries(4):
+            values = [
+                model.test_manager.test for model in manager.iterator(chunk_size=2)
+            ]
+
+        self.assertEqual(values, [1, 2, 3, 1, 2])
+        # One select for the rows, then one foreign key batch per chunk
+        self.assertIsNone(manager._cache)
+
+        with self.assertRaises(ManagerValidationError):
+            list(manager.iterator(chunk_size=0))
+
+        # Writes run on the connection the unfinished read holds
+        self.client.close()
+        for model in TestManager.all().iterator(chunk_size=2):
+            model.test += 10
+            model.save()
+
+            with self.client.atomic():
+                self.client.execute(
+                    "UPDATE test_manager SET test = test + 1 WHERE id = ?;", (model.id,)
+                )
+
+        self.assertEqual(
+            self.client.execute("SELECT test FROM test_manager;").fetchall(),
+            [(12,), (13,), (14,)],
+        )
+        self.assertFalse(self.client._pool._borrowed)
+        self.assertIsNone(self.client._pool.get_connection())
+
+        # In WAL mode, they run on another connection than the read's snapshot
+        self.client.close()
+        with patch.object(settings, "DATABASE_OPTIONS", {"preset": "throughput"}):
+            models = TestManager.all().iterator(chunk_size=1)
+            model = next(models)
+
+            thread = threading.Thread(
+                target=lambda: TestManager.where(id=2).update(test=0)
+            )
+            thread.start()
+            thread.join()
+
+            model.test = 50
+            model.save()
+            # The read keeps the snapshot it started with
+            self.assertEqual([model.test for model in models], [13, 14])
+            self.assertEqual(
+                self.client.execute("SELECT test FROM test_manager;").fetchall(),
+                [(50,), (0,), (14,)],
+            )
+            self.client.close()
+
+        self.client.execute("PRAGMA journal_mode = DELETE;")
+        self.client.close()
+
+    def test_async_api(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2), (3);")
+        threads = set()
+
+        manager_first = Manager.first
+
+        def first(manager):
+            threads.add(threading.current_thread())
+            return manager_first(manager)
+
+        async def run_queries():
+            with patch.object(Manager, "first", first):
+                first_model, last_model = await asyncio.gather(
+                    TestManager.aget(id=1), TestManager.where(id=3).afirst()
+                )
+
+            models = [model async for model in TestManager.all()]
+            model = TestManager(test=4)
+            await model.asave()
+            return first_model, last_model, models, model
+
+        first_model, last_model, models, model = asyncio.run(run_queries())
+
+        self.assertEqual((first_model.test, last_model.test), (1, 3))
+        self.assertEqual([model.test for model in models], [1, 2, 3])
+        self.assertEqual(model.id, 4)
+        self.assertNotIn(threading.current_thread(), threads)
+
+        async def run_in_atomic():
+            with TestManager.atomic():
+                await TestManager.all().aall()
+
+        with self.assertRaises(OperationalError):
+            asyncio.run(run_in_atomic())
+
+    def test_identity_map(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2);")
+        self.client.execute(
+            "INSERT INTO test_model (test_manager_id) VALUES (1), (2), (1);"
+        )
+        self.assertIsNot(TestManager.get(id=1), TestManager.get(id=1))
+
+        with identity_map() as session:
+            test_manager = TestManager.get(id=1)
+
+            with self.assertNumQueries(3):
+                self.assertIs(TestManager.get(id=1), test_manager)
+                self.assertIs(TestManager.where(test=1).first(), test_manager)
+
+                models = list(TestModel.all())
+                related = [model.test_manager for model in models]
+
+            self.assertEqual([model.test for model in related], [1, 2, 1])
+            self.assertIs(related[0], test_manager)
+            self.assertIs(related[2], test_manager)
+            # The where() query, the models, then only the missing test_manager
+
+            # Rows updated by a query are read again rather than served stale
+            TestManager.where(id=2).update(test=5)
+            self.assertEqual(TestManager.where(id=2).first().test, 5)
+            updated = TestManager.get(id=2)
+            self.assertEqual(updated.test, 5)
+            self.assertIsNot(updated, related[1])
+
+            updated.test = 6
+            updated.save()
+            self.assertIs(TestManager.get(id=2), updated)
+
+            test_manager.delete()
+            self.assertIsNone(TestManager.get(id=1))
+
+            del models, related, updated
+            gc.collect()
+            self.assertEqual(len(session), 0)
+
+    def test_order_by_and_slicing(self):
+        self.client.execute(
+            "INSERT INTO test_manager (test) VALUES (3), (1), (2), (1), (5);"
+        )
+
+        manager = TestManager.all().order_by("test", "-id")
+        self.assertEqual([model.id for model in manager], [4, 2, 3, 1, 5])
+        self.assertEqual([model.id for model in manager[1:3]], [2, 3])
+        self.assertEqual([model.id for model in manager[1:][1:][:2]], [3, 1])
+        self.assertEqual([model.id for model in manager[3:1]], [])
+        self.assertEqual(manager[2].id, 3)
+
+        with self.assertNumQueries() as queries:
+            self.assertEqual(TestManager.all().order_by("-test").first().test, 5)
+        self.assertIn("LIMIT 1", queries[-1])
+
+        with self.assertRaises(IndexError):
+            TestManager.all()[10]
+
+        with self.assertRaises(ManagerValidationError):
+            TestManager.all()[-1]
+
+        with self.assertRaises(LookupError):
+            TestManager.all().order_by("wrong_field")
+
+        self.assertEqual(TestManager.all().order_by("id")[3:].update(test=0), 2)
+        self.assertEqual(
+            self.client.execute("SELECT test FROM test_manager;").fetchall(),
+            [(3,), (1,), (2,), (0,), (0,)],
+        )
+
+    def test_count_and_exists(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2), (1);")
+
+        with self.assertNumQueries() as queries:
+            self.assertEqual(TestManager.where(test=1).count(), 2)
+            self.assertEqual(len(TestManager.all()[1:]), 2)
+            self.assertTrue(TestManager.where(test=2).exists())
+            self.assertFalse(TestManager.where(test=3))
+            self.assertIn(TestManager.get(id=2), TestManager.where(test=2))
+            self.assertNotIn(TestManager.get(id=2), TestManager.all()[2:])
+
+        self.assertTrue(all(query.startswith("SELECT") for query in queries))
+        self.assertIn("COUNT(*)", queries[0])
+        self.assertIn("LIMIT 1", queries[2])
+
+        manager = TestManager.all()
+        list(manager)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(manager), 3)
+            self.assertTrue(manager)
+
+        manager = TestManager.all()
+        with self.assertNumQueries(1):
+            if manager:
+                self.assertEqual(len(list(manager)), 3)
+
+        # A single fetched parent has no siblings to batch with
+        self.client.execute("INSERT INTO test_model (test_manager_id) VALUES (1), (1);")
+        test_manager = TestManager.get(id=1)
+        with self.assertNumQueries() as queries:
+            self.assertEqual(test_manager.test_model_set.count(), 2)
+            self.assertTrue(test_manager.test_model_set.exists())
+        self.assertIn("COUNT(*)", queries[0])
+        self.assertIn("LIMIT 1", queries[1])
+
+        self.assertEqual(TestManager.none().count(), 0)
+
+        # Single row reads give their connection back without the finalizer
+        self.client.close()
+        with patch.object(PooledCursor, "__del__", lambda cursor: None):
+            self.assertEqual(TestManager.where(test=2).first().id, 2)
+            self.assertEqual(TestManager.where(test=1).count(), 2)
+            self.assertTrue(TestManager.where(test=2).exists())
+        self.assertFalse(self.client._pool._borrowed)
+
+    def test_aggregate_and_group_by(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2), (4);")
+        self.client.execute(
+            "INSERT INTO test_model (test_manager_id) VALUES (1), (3), (3), (2);"
+        )
+
+        self.assertEqual(
+            TestManager.where(test__in=(1, 2)).aggregate(
+                total=Sum("test"), n=Count("id"), average=Avg("test")
+            ),
+            {"total": 3, "n": 2, "average": 1.5},
+        )
+        self.assertEqual(
+            TestModel.all().aggregate(
+                n=Count("test_manager", distinct=True),
+                highest=Max("test_manager__test"),
+            ),
+            {"n": 3, "highest": 4},
+        )
+        self.assertEqual(TestManager.none().aggregate(n=Count("id")), {"n": 0})
+
+        manager = (
+            TestModel.all()
+            .group_by("test_manager__test")
+            .annotate(n=Count("id"))
+            .order_by("-test_manager")
+        )
+        self.assertEqual(
+            list(manager),
+            [
+                {"test_manager__test": 4, "n": 2},
+                {"test_manager__test": 2, "n": 1},
+                {"test_manager__test": 1, "n": 1},
+            ],
+        )
+        self.assertEqual(manager.count(), 3)
+
+        with self.assertRaises(ManagerValidationError):
+            TestManager.all().annotate(n=Count("id"))
+
+        with self.assertRaises(LookupError):
+            TestManager.all().aggregate(n=Count("test__in"))
+
+    def test_values(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2);")
+        self.client.execute("INSERT INTO test_model (test_manager_id) VALUES (2), (1);")
+
+        with patch.object(TestModel, "__init__") as init:
+            self.assertEqual(
+                list(TestModel.all().values()),
+                [{"id": 1, "test_manager_id": 2}, {"id": 2, "test_manager_id": 1}],
+            )
+            self.assertEqual(
+                list(TestModel.all().values_list("id", "test_manager__test")),
+                [(1, 2), (2, 1)],
+            )
+            manager = TestModel.all().order_by("-id").values_list("id", flat=True)
+            self.assertEqual(list(manager), [2, 1])
+            self.assertEqual(manager[0], 2)
+            self.assertIn(1, manager)
+
+        init.assert_not_called()
+
+        with self.assertRaises(ManagerValidationError):
+            TestModel.all().values_list("id", "test_manager", flat=True)
+
+        # Rows with a null relation are kept
+        self.client.execute(
+            "INSERT INTO test_related_model (test_model_id) VALUES (1), (NULL);"
+        )
+        manager = TestRelatedModel.all().values_list(
+            "id", "test_model__test_manager_id"
+        )
+        self.assertEqual(list(manager), [(1, 2), (2, None)])
+        self.assertEqual(manager.count(), 2)
+
+    def test_select_related(self):
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1), (2);")
+        self.client.execute("INSERT INTO test_model (test_manager_id) VALUES (1), (2);")
+        self.client.execute(
+            "INSERT INTO test_related_model (test_model_id) VALUES (2), (NULL), (1);"
+        )
+
+        with self.assertRaises(LookupError):
+            TestRelatedModel.all().select_related("test_model__test")
+
+        with self.assertNumQueries(1):
+            models = list(
+                TestRelatedModel.all().select_related("test_model__test_manager")
+            )
+            values = [
+                model.test_model and model.test_model.test_manager.test
+                for model in models
+            ]
+
+        self.assertEqual(values, [2, None, 1])
+
+        # A relation with select_related leaves its batch, its rows differ
+        test_managers = list(TestManager.all())
+        manager = test_managers[1].test_model_set.select_related("test_manager")
+        list(test_managers[0].test_model_set)
+        self.assertEqual([model.test_manager.test for model in manager], [2])
+
     def test_none(self):
         self.assertFalse(TestManager.none())
+        self.assertIsNone(TestManager.none().first())
+
+        # An unsaved model has no related rows, whatever the table holds
+        self.client.execute("INSERT INTO test_manager (test) VALUES (1);")
+        self.client.execute("INSERT INTO test_model (test_manager_id) VALUES (1);")
+        self.assertIsNone(TestManager(test=2).test_model_set.first())
 
     def tearDown(self) -> None:
         self.client.execute("DROP TABLE test_manager;")
         self.client.execute("DROP TABLE test_model;")
+        self.client.execute("DROP TABLE test_related_model;")
@@ -1,16 +1,19 @@
-from unittest import TestCase
+from unittest.mock import patch
 
 from rogue.models import Model, Field
-from rogue.models.errors import FieldValidationError
+from rogue.models.errors import FieldValidationError, ModelValidationError
+from rogue.models.fields import RelationField
 from rogue.backends.sqlite.client import DatabaseClient
 from rogue.settings import settings
 
+from ..utils import QueryTestCase
+
 
 class TestModel(Model):
     test: Field[int]
 
 
-class ModelTestCase(TestCase):
+class ModelTestCase(QueryTestCase):
     def setUp(self):
         self.client = DatabaseClient(settings.DATABASE_NAME)
         self.client.execute(
@@ -113,6 +116,18 @@ class ModelTestCase(TestCase):
         # Make sure the cache is used and the DB is not hit each time
         self.assertIs(defined_model.test_model, defined_model.test_model)
 
+        # Relations are data descriptors on the class, plain fields are not
+        self.assertIsInstance(DefinedModel.__dict__["test_model"], RelationField)
+        self.assertNotIn("test_model", defined_model.__dict__)
+
+        defined_model.other_test_model = wrong_test_model
+        self.assertEqual(defined_model.other_test_model_id, wrong_test_model.id)
+        self.assertEqual(defined_model.other_test_model.test, 6)
+        self.assertEqual(
+            defined_model.get_changed_fields(),
+            {"other_test_model_id": wrong_test_model.id},
+        )
+
     def test_model_with_one_to_one_relationship(self):
         # 2 related fields with the same name
         with self.assertRaises(FieldValidationError):
@@ -177,6 +192,92 @@ class ModelTestCase(TestCase):
             "DROP TABLE m2m_defined_model_test_models_test_model_m2_m_defined_model_set_through"
         )
 
+    def test_many_to_many_relationships_are_fetched_in_batch(self):
+        class BatchM2mModel(Model):
+            test: Field[int | None]
+            test_models: Field[TestModel](many_to_many=True)
+
+        through_table_name = BatchM2mModel.test_models._through_model.table_name
+        self.client.execute(
+            "CREATE TABLE batch_m2m_model (id integer PRIMARY KEY autoincrement, test integer);"
+        )
+        self.client.execute(
+            f"CREATE TABLE {through_table_name} (id integer PRIMARY KEY autoincrement, "
+            "batch_m2m_model_id integer NOT NULL, test_model_id integer NOT NULL);"
+        )
+
+        test_models = [TestModel(test=value) for value in (1, 2, 3)]
+        for test_model in test_models:
+            test_model.save()
+
+        BatchM2mModel(test_models=test_models[:2]).save()
+        BatchM2mModel(test_models=test_models[1:]).save()
+        BatchM2mModel(test_models=[]).save()
+
+        models = list(BatchM2mModel.all())
+        with self.assertNumQueries(1):
+            values = [
+                sorted(test_model.test for test_model in model.test_models)
+                for model in models
+            ]
+
+        self.assertEqual(values, [[1, 2], [2, 3], []])
+
+        models = list(BatchM2mModel.all())
+        with patch.object(self.client, "get_max_variable_number", return_value=2):
+            with self.assertNumQueries(2):
+                values = [
+                    sorted(test_model.test for test_model in model.test_models)
+                    for model in models
+                ]
+
+        self.assertEqual(values, [[1, 2], [2, 3], []])
+
+        self.client.execute("DROP TABLE batch_m2m_model;")
+        self.client.execute(f"DROP TABLE {through_table_name};")
+
+    def test_many_to_many_add_remove_and_set(self):
+        class EditedM2mModel(Model):
+            test: Field[int | None]
+            test_models: Field[TestModel](many_to_many=True)
+
+        through_table_name = EditedM2mModel.test_models._through_model.table_name
+        self.client.execute(
+            f"CREATE TABLE {through_table_name} (id integer PRIMARY KEY autoincrement, "
+            "edited_m2m_model_id integer NOT NULL, test_model_id integer NOT NULL);"
+        )
+
+        test_models = TestModel.bulk_create(
+            TestModel(test=value) for value in (1, 2, 3)
+        )
+        model = EditedM2mModel(id_=1, test_models=[])
+
+        # The through rows are written with a single executemany
+        with self.assertNumQueries(1) as queries:
+            model.test_models.add(test_models)
+
+        self.assertTrue(queries[0].startswith("INSERT"))
+        self.assertEqual(len(model.test_models), 3)
+
+        model.test_models.remove(test_models[0])
+        self.assertEqual([test_model.test for test_model in model.test_models], [2, 3])
+
+        model.test_models.set([test_models[0], test_models[2]])
+        self.assertEqual(
+            sorted(test_model.test for test_model in model.test_models), [1, 3]
+        )
+
+        # Removals are split to stay under the bound variable limit, one of
+        # the variables being the id of the model
+        with patch.object(self.client, "get_max_variable_number", return_value=3):
+            with self.assertNumQueries() as queries:
+                model.test_models.remove(test_models)
+
+        self.assertEqual(len([query for query in queries if "DELETE" in query]), 2)
+        self.assertEqual(len(model.test_models), 0)
+
+        self.client.execute(f"DROP TABLE {through_table_name};")
+
     def test_model_instantiations(self):
         class DefinedModel(Model):
             field_with_default: Field[int] = 20
@@ -209,6 +310,50 @@ class ModelTestCase(TestCase):
         self.assertEqual(test_model.id, initial_id)
         self.assertEqual(test_model.test, 5)
 
+        # Only the saved row is updated
+        other_test_model = TestModel(test=4)
+        other_test_model.save()
+        test_model.test = 6
+        test_model.save()
+        self.assertEqual(TestModel.get(id=other_test_model.id).test, 4)
+
+    def test_model_metadata_is_precomputed(self):
+        self.assertIs(TestModel.get_fields(), TestModel.get_fields())
+        self.assertEqual(TestModel.get_field_names(), ("id", "test"))
+
+        with self.assertRaises(TypeError):
+            TestModel.get_fields()["other"] = None
+
+        test_model = TestModel(test=3)
+        test_model.save()
+        self.assertEqual(test_model.get_changed_fields(), {})
+
+        test_model.test = 4
+        self.assertEqual(test_model.get_changed_fields(), {"test": 4})
+
+    def test_from_db_row(self):
+        with patch.object(TestModel, "__init__") as init:
+            test_model = TestModel.from_db_row((1, 3))
+
+        init.assert_not_called()
+        self.assertEqual((test_model.id, test_model.test), (1, 3))
+        self.assertEqual(test_model.get_changed_fields(), {})
+
+        class HydratedModel(Model):
+            test_model: Field[TestModel]
+
+        hydrated_model = HydratedModel.from_db_row((1, test_model.id))
+        self.assertEqual(hydrated_model._foreign_relations, {})
+        self.assertEqual(hydrated_model._get_relation("test_model").id, 1)
+
+    def test_bulk_create(self):
+        test_models = TestModel.bulk_create(TestModel(test=value) for value in (3, 4))
+        self.assertEqual([test_model.id for test_model in test_models], [1, 2])
+        self.assertEqual(TestModel.get(id=2).test, 4)
+
+        with self.assertRaises(ModelValidationError):
+            TestModel.bulk_create(test_models)
+
     def test_delete_model(self):
         self.client.execute("INSERT INTO test_model (test) VALUES (42)")
         model = TestModel.get(test=42)
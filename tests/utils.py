@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from unittest import TestCase
+from unittest.mock import patch
+
+from rogue.backends.sqlite.client import DatabaseClient
+from rogue.settings import settings
+
+
+class QueryTestCase(TestCase):
+    @contextmanager
+    def assertNumQueries(self, num=None):
+        # Yields the statements sent to the database while the block runs. An
+        # executemany counts as one, and so does a read served by execute.
+        client = DatabaseClient(settings.DATABASE_NAME)
+        queries = []
+        depth = 0
+
+        def capture(method):
+            def wrapper(statement, *args, **kwargs):
+                nonlocal depth
+
+                if depth == 0:
+                    queries.append(statement)
+
+                depth += 1
+                try:
+                    return method(statement, *args, **kwargs)
+                finally:
+                    depth -= 1
+
+            return wrapper
+
+        with patch.object(
+            client, "execute", capture(client.execute)
+        ), patch.object(
+            client, "execute_read", capture(client.execute_read)
+        ), patch.object(
+            client, "execute_many", capture(client.execute_many)
+        ):
+            yield queries
+
+        if num is not None:
+            self.assertEqual(
+                len(queries),
+                num,
+                f"{len(queries)} queries were made, expected {num}: {queries}",
+            )